@@ -0,0 +1,529 @@
+
+import argparse  # command line for the different benchmarks
+import itertools, json, os, platform, shlex, sys
+import random
+import socket  # only used to find free loopback ports
+import subprocess, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    '''ask the kernel for an unused UDP port on loopback'''
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_input(path, size, seed=None, content="random"):
+    '''
+    write size bytes of printable text so the sender's text mode can read it
+    :param content: "random" characters, or "csv" lines that compress like real logs and exports
+    '''
+    rng = random.Random(size if seed is None else seed)
+    if content == "csv":
+        lines = []
+        length = 0
+        while length < size:
+            line = (f"2024-05-{rng.randint(1, 31):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00,"
+                    f"sensor-{rng.randint(1, 40)},{rng.uniform(15, 30):.2f},{rng.choice(('OK', 'OK', 'OK', 'WARN'))}\n")
+            lines.append(line)
+            length += len(line)
+        text = "".join(lines)[:size]
+    else:
+        alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 \n"
+        text = "".join(rng.choice(alphabet) for _ in range(size))
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def wait_child(proc, deadline):
+    '''reap proc with os.wait4 so its own CPU time is returned, killing it after deadline'''
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid == proc.pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage.ru_utime + usage.ru_stime, proc.returncode
+        if time.time() > deadline:
+            proc.kill()
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage.ru_utime + usage.ru_stime, None
+        time.sleep(0.01)
+
+
+def read_counters(path, names):
+    '''the named counters from an endpoint's --stats file, None where it was never written'''
+    try:
+        with open(path) as f:
+            counters = json.load(f)["counters"]
+    except (FileNotFoundError, ValueError):
+        counters = {}
+    return tuple(counters.get(name) for name in names)
+
+
+def run_transfer(size, max_win, rto, flp=0.0, rlp=0.0, sender_opts=(), receiver_opts=(), timeout=120.0,
+                 counters=False, channel_opts=None, content="random"):
+    '''
+    Transfer a generated file of size bytes over loopback in an isolated directory
+    :param content: what the file holds, see make_input
+    :param counters: add the endpoints' segment and syscall counts from their --stats files
+    :param channel_opts: arguments for channel.py, which is then put between sender and receiver
+    :return: dict with completion time, CPU seconds of each endpoint and whether the output matched
+    '''
+    with tempfile.TemporaryDirectory(prefix="ptp-bench-") as workdir:
+        make_input(os.path.join(workdir, "input.txt"), size, content=content)
+        sender_port, receiver_port = free_port(), free_port()
+        devnull = subprocess.DEVNULL
+        stats_opts = ("--stats", "sender.json", "--stats", "receiver.json") if counters else ()
+        receiver = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "reciever.py"), str(receiver_port), str(sender_port),
+             "FileReceived.txt", str(flp), str(rlp), *receiver_opts, *stats_opts[2:]],
+            cwd=workdir, stdout=devnull, stderr=devnull)
+        target_port = receiver_port
+        if channel_opts is not None:
+            target_port = free_port()
+            channel = subprocess.Popen(
+                [sys.executable, os.path.join(HERE, "channel.py"), str(target_port), str(receiver_port), *channel_opts],
+                cwd=workdir, stdout=subprocess.PIPE, stderr=devnull, text=True)
+        time.sleep(0.3)  # let the receiver bind before the first SYN
+        start = time.time()
+        sender = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "sender.py"), str(sender_port), str(target_port),
+             "input.txt", str(max_win), str(rto), *sender_opts, *stats_opts[:2]],
+            cwd=workdir, stdout=devnull, stderr=devnull)
+        deadline = start + timeout
+        sender_cpu, sender_rc = wait_child(sender, deadline)
+        elapsed = time.time() - start
+        receiver_cpu, receiver_rc = wait_child(receiver, max(deadline, time.time() + 2))
+        extra = {}
+        if channel_opts is not None:
+            channel.terminate()
+            output, _ = channel.communicate()
+            extra["channel_opts"] = list(channel_opts)
+            extra["channel"] = json.loads(output) if output.strip() else None
+        if counters:
+            extra["segments_sent"], extra["send_calls"], extra["retransmissions"], extra["bytes_sent"] = read_counters(
+                os.path.join(workdir, "sender.json"), ("segments_sent", "send_calls", "retransmissions", "bytes_sent"))
+            extra["segments_received"], extra["recv_calls"], extra["acks_sent"], extra["fec_recovered"] = read_counters(
+                os.path.join(workdir, "receiver.json"), ("segments_received", "recv_calls", "acks_sent", "fec_recovered"))
+
+        with open(os.path.join(workdir, "input.txt"), "rb") as f:
+            expected = f.read()
+        try:
+            with open(os.path.join(workdir, "FileReceived.txt"), "rb") as f:
+                received = f.read()
+        except FileNotFoundError:
+            received = b""
+        return {
+            "size": size,
+            "max_win": max_win,
+            "rto": rto,
+            "flp": flp,
+            "rlp": rlp,
+            "sender_opts": list(sender_opts),
+            "receiver_opts": list(receiver_opts),
+            "completed": sender_rc is not None and receiver_rc is not None,
+            "verified": received == expected,
+            "elapsed": round(elapsed, 3),
+            "goodput_kbps": round(size * 8 / 1000 / elapsed, 1) if received == expected else 0.0,
+            "sender_cpu": round(sender_cpu, 3),
+            "receiver_cpu": round(receiver_cpu, 3),
+            **extra,
+        }
+
+
+def run_load(clients, size, max_win, rto, flp=0.0, rlp=0.0, sender_opts=(), receiver_opts=(), timeout=120.0):
+    '''
+    N senders started together against one receiver in --multi mode
+    Each sender runs in its own subdirectory so their logs do not collide.
+    :return: dict with the time until the last sender finished, aggregate goodput and verification
+    '''
+    with tempfile.TemporaryDirectory(prefix="ptp-load-") as workdir:
+        receiver_port = free_port()
+        sender_ports = set()
+        while len(sender_ports) < clients:
+            sender_ports.add(free_port())
+        sender_ports = sorted(sender_ports - {receiver_port})
+        devnull = subprocess.DEVNULL
+        receiver = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "reciever.py"), str(receiver_port), "0",
+             "received-{port}.txt", str(flp), str(rlp), "--multi", "--connections", str(len(sender_ports)),
+             *receiver_opts],
+            cwd=workdir, stdout=devnull, stderr=devnull)
+        for port in sender_ports:
+            os.mkdir(os.path.join(workdir, str(port)))
+            make_input(os.path.join(workdir, str(port), "input.txt"), size, seed=port)
+        time.sleep(0.3)  # let the receiver bind before the first SYN
+        start = time.time()
+        senders = [subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "sender.py"), str(port), str(receiver_port),
+             "input.txt", str(max_win), str(rto), *sender_opts],
+            cwd=os.path.join(workdir, str(port)), stdout=devnull, stderr=devnull) for port in sender_ports]
+        deadline = start + timeout
+        outcomes = [wait_child(sender, deadline) for sender in senders]
+        elapsed = time.time() - start
+        receiver_cpu, receiver_rc = wait_child(receiver, max(deadline, time.time() + 2))
+
+        verified = 0
+        for port in sender_ports:
+            with open(os.path.join(workdir, str(port), "input.txt"), "rb") as f:
+                expected = f.read()
+            try:
+                with open(os.path.join(workdir, f"received-{port}.txt"), "rb") as f:
+                    verified += f.read() == expected
+            except FileNotFoundError:
+                pass
+        return {
+            "clients": len(sender_ports),
+            "size": size,
+            "max_win": max_win,
+            "rto": rto,
+            "flp": flp,
+            "rlp": rlp,
+            "sender_opts": list(sender_opts),
+            "receiver_opts": list(receiver_opts),
+            "completed": all(rc is not None for _, rc in outcomes) and receiver_rc is not None,
+            "verified": verified == len(sender_ports),
+            "verified_clients": verified,
+            "elapsed": round(elapsed, 3),
+            "aggregate_goodput_kbps": round(verified * size * 8 / 1000 / elapsed, 1),
+            "sender_cpu": round(sum(cpu for cpu, _ in outcomes), 3),
+            "receiver_cpu": round(receiver_cpu, 3),
+        }
+
+
+def bench_cpu(args):
+    '''CPU seconds per MB transferred for each sender wait mode'''
+    results = []
+    for mode in args.modes:
+        for _ in range(args.repeat):
+            result = run_transfer(args.size, args.max_win, args.rto,
+                                  sender_opts=["--wait-mode", mode], timeout=args.timeout)
+            result["wait_mode"] = mode
+            result["sender_cpu_per_mb"] = round(result["sender_cpu"] / (args.size / 1e6), 3)
+            results.append(result)
+            print(f"{mode:<7}{result['elapsed']:>9.2f}s wall{result['sender_cpu']:>9.3f}s cpu"
+                  f"{result['sender_cpu_per_mb']:>10.3f}s/MB  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def bench_sack(args):
+    '''goodput with and without selective acknowledgements across forward loss rates'''
+    results = []
+    for flp in args.loss:
+        for label, opts in (("cumulative", []), ("sack", ["--sack"])):
+            for _ in range(args.repeat):
+                result = run_transfer(args.size, args.max_win, args.rto, flp=flp,
+                                      sender_opts=opts + ["--log-mode", "off"], timeout=args.timeout)
+                result["ack_mode"] = label
+                results.append(result)
+                print(f"flp={flp:<5}{label:<11}{result['elapsed']:>9.2f}s{result['goodput_kbps']:>12.1f} kbit/s"
+                      f"  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def bench_engine(args):
+    '''CPU seconds of both endpoints with the thread engine and the asyncio engine'''
+    results = []
+    for engine in args.engines:
+        for _ in range(args.repeat):
+            opts = ["--engine", engine, "--log-mode", "off"]
+            result = run_transfer(args.size, args.max_win, args.rto, sender_opts=opts,
+                                  receiver_opts=opts, timeout=args.timeout)
+            result["engine"] = engine
+            results.append(result)
+            print(f"{engine:<8}{result['elapsed']:>9.2f}s wall{result['sender_cpu']:>9.3f}s sender cpu"
+                  f"{result['receiver_cpu']:>9.3f}s receiver cpu  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def bench_batch(args):
+    '''packets per second and syscalls per MB, one segment per call vs batches with and without GSO/GRO'''
+    batch = str(args.batch)
+    # v2 headers, a v1 sender caps the window at 32768 bytes
+    configs = (("single", ["--batch", "1"], []),
+               ("batch", ["--batch", batch, "--gso", "off"], []),
+               ("gso", ["--batch", batch], []),
+               ("gso+gro", ["--batch", batch], ["--gro"]))
+    results = []
+    for flp in args.loss:
+        for label, sender_opts, receiver_opts in configs:
+            for _ in range(args.repeat):
+                result = run_transfer(args.size, args.max_win, args.rto, flp,
+                                      sender_opts=sender_opts + ["--header-version", "2", "--log-mode", "off"],
+                                      receiver_opts=receiver_opts + ["--log-mode", "off"], timeout=args.timeout,
+                                      counters=True)
+                result["path"] = label
+                megabytes = args.size / 1e6
+                if result["send_calls"] is not None:
+                    result["packets_per_s"] = round(result["segments_sent"] / result["elapsed"])
+                    result["send_calls_per_mb"] = round(result["send_calls"] / megabytes, 1)
+                if result["recv_calls"] is not None:
+                    result["recv_calls_per_mb"] = round(result["recv_calls"] / megabytes, 1)
+                results.append(result)
+                print(f"flp={flp:<5} {label:<9}{result['elapsed']:>8.2f}s{result.get('packets_per_s', 0):>9} pkt/s"
+                      f"{result.get('send_calls_per_mb', 0):>9} send/MB{result.get('recv_calls_per_mb', 0):>9} recv/MB"
+                      f"{result['retransmissions'] or 0:>7} rexmit  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def bench_ack(args):
+    '''reverse packets, goodput and receiver CPU with an ACK per segment vs coalesced ACKs'''
+    results = []
+    for flp in args.loss:
+        for every in args.ack_every:
+            for _ in range(args.repeat):
+                receiver_opts = ["--log-mode", "off", "--ack-every", str(every), "--ack-delay", str(args.ack_delay)]
+                result = run_transfer(args.size, args.max_win, args.rto, flp, sender_opts=["--log-mode", "off", "--sack"],
+                                      receiver_opts=receiver_opts, timeout=args.timeout, counters=True)
+                result["ack_every"] = every
+                if result["acks_sent"] is not None and result["segments_received"]:
+                    result["acks_per_segment"] = round(result["acks_sent"] / result["segments_received"], 3)
+                results.append(result)
+                print(f"flp={flp:<5} ack_every={every:<3}{result['elapsed']:>8.2f}s{result['goodput_kbps']:>10} kbit/s"
+                      f"{result.get('acks_per_segment', 0):>7} acks/seg{result['receiver_cpu']:>8.3f}s receiver cpu"
+                      f"  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def bench_fec(args):
+    '''completion time and retransmissions without and with XOR parity across loss rates'''
+    results = []
+    for flp in args.loss:
+        for group in args.groups:
+            for _ in range(args.repeat):
+                sender_opts = ["--log-mode", "off", "--fec", str(group), *shlex.split(args.sender_opts)]
+                result = run_transfer(args.size, args.max_win, args.rto, flp, sender_opts=sender_opts,
+                                      receiver_opts=["--log-mode", "off"], timeout=args.timeout, counters=True)
+                result["fec"] = group
+                results.append(result)
+                print(f"flp={flp:<5} fec={group:<3}{result['elapsed']:>8.2f}s{result['goodput_kbps']:>10} kbit/s"
+                      f"{result['retransmissions'] or 0:>6} retransmissions{result['fec_recovered'] or 0:>6} rebuilt"
+                      f"  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def bench_compress(args):
+    '''wire bytes, segments and completion time of compressible and random files per codec'''
+    results = []
+    for content in args.contents:
+        for codec in args.codecs:
+            for _ in range(args.repeat):
+                sender_opts = ["--log-mode", "off"] + ([] if codec == "none" else ["--compress", codec])
+                result = run_transfer(args.size, args.max_win, args.rto, args.flp, sender_opts=sender_opts,
+                                      receiver_opts=["--log-mode", "off"], timeout=args.timeout, counters=True,
+                                      content=content)
+                result["content"] = content
+                result["codec"] = codec
+                if result["bytes_sent"] is not None:
+                    result["wire_ratio"] = round(result["bytes_sent"] / args.size, 3)
+                results.append(result)
+                print(f"{content:<7}{codec:<6}{result['elapsed']:>8.2f}s{result.get('wire_ratio', 0):>7} of the bytes"
+                      f"{result['segments_sent'] or 0:>7} segments{result['sender_cpu']:>8.3f}s sender cpu"
+                      f"  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def bench_sweep(args):
+    '''every combination of size, max_win, rto, flp and rlp, verified, with retransmissions and CPU time'''
+    sender_opts = shlex.split(args.sender_opts)
+    receiver_opts = shlex.split(args.receiver_opts)
+    results = []
+    for size, max_win, rto, flp, rlp in itertools.product(args.sizes, args.max_wins, args.rtos, args.flps, args.rlps):
+        for _ in range(args.repeat):
+            result = run_transfer(size, max_win, rto, flp, rlp, sender_opts=sender_opts,
+                                  receiver_opts=receiver_opts, timeout=args.timeout, counters=True)
+            results.append(result)
+            print(f"size={size:<9}max_win={max_win:<7}rto={rto:<5}flp={flp:<5}rlp={rlp:<5}"
+                  f"{result['elapsed']:>8.2f}s{result['goodput_kbps']:>10.1f} kbit/s"
+                  f"{result['retransmissions'] or 0:>6} rtx  verified={result['verified']}", file=sys.stderr)
+    return results
+
+
+def config_key(result):
+    '''what identifies one benchmark configuration across runs'''
+    fields = ("path", "engine", "wait_mode", "ack_mode", "clients", "size", "max_win", "rto", "flp", "rlp",
+              "sender_opts", "receiver_opts", "channel_opts")
+    return json.dumps({field: result.get(field) for field in fields}, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        data = json.load(f)
+    # files written before the meta block was added are a bare list
+    return data["results"] if isinstance(data, dict) else data
+
+
+def bench_compare(args):
+    '''mean completion time per configuration in two result files, slower by more than threshold is a regression'''
+    def means(results):
+        grouped = {}
+        for result in results:
+            grouped.setdefault(config_key(result), []).append(result)
+        return {key: (sum(r["elapsed"] for r in group) / len(group), all(r["verified"] for r in group))
+                for key, group in grouped.items()}
+
+    baseline, current = means(load_results(args.baseline)), means(load_results(args.current))
+    results = []
+    for key in sorted(baseline.keys() & current.keys()):
+        (old, old_ok), (new, new_ok) = baseline[key], current[key]
+        ratio = new / old if old else float("inf")
+        regression = ratio > args.threshold or (old_ok and not new_ok)
+        results.append({"config": json.loads(key), "baseline_elapsed": round(old, 3),
+                        "current_elapsed": round(new, 3), "ratio": round(ratio, 3),
+                        "verified": new_ok, "regression": regression})
+        if regression:
+            print(f"REGRESSION {ratio:.2f}x  {key}", file=sys.stderr)
+    print(f"{len(results)} configurations compared, "
+          f"{sum(r['regression'] for r in results)} regressions", file=sys.stderr)
+    return results
+
+
+def run_meta(args):
+    '''where and when the results were taken, so files from different runs can be compared'''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "benchmark": args.bench,
+        "argv": sys.argv[1:],
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def bench_load(args):
+    '''aggregate goodput of one --multi receiver serving N senders in parallel'''
+    results = []
+    for clients in args.clients:
+        for _ in range(args.repeat):
+            result = run_load(clients, args.size, args.max_win, args.rto, flp=args.flp, rlp=args.rlp,
+                              sender_opts=["--log-mode", "off"], receiver_opts=["--log-mode", "off"],
+                              timeout=args.timeout)
+            results.append(result)
+            print(f"clients={clients:<4}{result['elapsed']:>9.2f}s{result['aggregate_goodput_kbps']:>12.1f} kbit/s"
+                  f"  verified={result['verified_clients']}/{result['clients']}", file=sys.stderr)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmarks for the PTP sender and receiver on loopback")
+    parser.add_argument("--json", help="write the results to this file instead of stdout")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    cpu = sub.add_parser("cpu", help="sender CPU seconds per MB, busy-wait vs event-driven waiting")
+    cpu.add_argument("--size", type=int, default=100_000, help="bytes to transfer")
+    cpu.add_argument("--max-win", type=int, default=5000)
+    cpu.add_argument("--rto", type=int, default=300)
+    cpu.add_argument("--modes", nargs="+", default=["spin", "event"])
+    cpu.add_argument("--repeat", type=int, default=1)
+    cpu.add_argument("--timeout", type=float, default=300.0)
+    cpu.set_defaults(func=bench_cpu)
+
+    sack = sub.add_parser("sack", help="goodput of cumulative vs selective ACKs across loss rates")
+    sack.add_argument("--size", type=int, default=500_000)
+    sack.add_argument("--max-win", type=int, default=20000)
+    sack.add_argument("--rto", type=int, default=200)
+    sack.add_argument("--loss", type=float, nargs="+", default=[0.0, 0.01, 0.05, 0.1, 0.2])
+    sack.add_argument("--repeat", type=int, default=3)
+    sack.add_argument("--timeout", type=float, default=300.0)
+    sack.set_defaults(func=bench_sack)
+
+    engine = sub.add_parser("engine", help="CPU time of the thread and asyncio engines")
+    engine.add_argument("--size", type=int, default=1_000_000)
+    engine.add_argument("--max-win", type=int, default=20000)
+    engine.add_argument("--rto", type=int, default=200)
+    engine.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+    engine.add_argument("--repeat", type=int, default=1)
+    engine.add_argument("--timeout", type=float, default=300.0)
+    engine.set_defaults(func=bench_engine)
+
+    batch = sub.add_parser("batch", help="packets/s and syscalls per MB with batched, GSO and GRO paths")
+    batch.add_argument("--size", type=int, default=5_000_000)
+    batch.add_argument("--max-win", type=int, default=64000)
+    batch.add_argument("--rto", type=int, default=200)
+    batch.add_argument("--batch", type=int, default=32, help="segments per batch")
+    batch.add_argument("--loss", type=float, nargs="+", default=[0.0, 0.05])
+    batch.add_argument("--repeat", type=int, default=1)
+    batch.add_argument("--timeout", type=float, default=300.0)
+    batch.set_defaults(func=bench_batch)
+
+    ack = sub.add_parser("ack", help="reverse packets, goodput and receiver CPU with coalesced ACKs")
+    ack.add_argument("--size", type=int, default=2_000_000)
+    ack.add_argument("--max-win", type=int, default=32000)
+    ack.add_argument("--rto", type=int, default=200)
+    ack.add_argument("--ack-every", type=int, nargs="+", default=[1, 2, 4, 8])
+    ack.add_argument("--ack-delay", type=float, default=10)
+    ack.add_argument("--loss", type=float, nargs="+", default=[0.0, 0.02])
+    ack.add_argument("--repeat", type=int, default=1)
+    ack.add_argument("--timeout", type=float, default=300.0)
+    ack.set_defaults(func=bench_ack)
+
+    fec = sub.add_parser("fec", help="completion time without and with XOR parity across loss rates")
+    fec.add_argument("--size", type=int, default=1_000_000)
+    fec.add_argument("--max-win", type=int, default=20000)
+    fec.add_argument("--rto", type=int, default=200)
+    fec.add_argument("--groups", type=int, nargs="+", default=[0, 4, 8, 16], help="segments per parity, 0 is off")
+    fec.add_argument("--loss", type=float, nargs="+", default=[0.0, 0.01, 0.05, 0.1])
+    fec.add_argument("--sender-opts", default="", help="extra sender arguments, one string, e.g. --sack")
+    fec.add_argument("--repeat", type=int, default=1)
+    fec.add_argument("--timeout", type=float, default=300.0)
+    fec.set_defaults(func=bench_fec)
+
+    compress = sub.add_parser("compress", help="wire bytes and completion time with each compression codec")
+    compress.add_argument("--size", type=int, default=2_000_000)
+    compress.add_argument("--max-win", type=int, default=20000)
+    compress.add_argument("--rto", type=int, default=200)
+    compress.add_argument("--flp", type=float, default=0.0)
+    compress.add_argument("--codecs", nargs="+", default=["none", "zlib", "bz2", "lzma"])
+    compress.add_argument("--contents", nargs="+", choices=("csv", "random"), default=["csv", "random"])
+    compress.add_argument("--repeat", type=int, default=1)
+    compress.add_argument("--timeout", type=float, default=300.0)
+    compress.set_defaults(func=bench_compress)
+
+    load = sub.add_parser("load", help="aggregate goodput of N parallel senders against one --multi receiver")
+    load.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    load.add_argument("--size", type=int, default=200_000)
+    load.add_argument("--max-win", type=int, default=20000)
+    load.add_argument("--rto", type=int, default=200)
+    load.add_argument("--flp", type=float, default=0.0)
+    load.add_argument("--rlp", type=float, default=0.0)
+    load.add_argument("--repeat", type=int, default=1)
+    load.add_argument("--timeout", type=float, default=300.0)
+    load.set_defaults(func=bench_load)
+
+    sweep = sub.add_parser("sweep", help="grid of size, max_win, rto, flp and rlp with verification and retransmissions")
+    sweep.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    sweep.add_argument("--max-wins", type=int, nargs="+", default=[5000, 20000])
+    sweep.add_argument("--rtos", type=int, nargs="+", default=[100, 300])
+    sweep.add_argument("--flps", type=float, nargs="+", default=[0.0, 0.05])
+    sweep.add_argument("--rlps", type=float, nargs="+", default=[0.0, 0.05])
+    sweep.add_argument("--sender-opts", default="--log-mode off", help="extra sender arguments, one string")
+    sweep.add_argument("--receiver-opts", default="--log-mode off", help="extra receiver arguments, one string")
+    sweep.add_argument("--repeat", type=int, default=1)
+    sweep.add_argument("--timeout", type=float, default=300.0)
+    sweep.set_defaults(func=bench_sweep)
+
+    compare = sub.add_parser("compare", help="flag configurations that got slower between two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio counted as a regression")
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    meta = run_meta(args)
+    results = args.func(args)
+    output = json.dumps({"meta": meta, "results": results}, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.bench == "compare" and any(result["regression"] for result in results):
+        sys.exit(1)
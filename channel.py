@@ -0,0 +1,266 @@
+
+'''
+Network emulator that sits between the sender and the receiver as a UDP proxy
+
+    python3 channel.py 6000 5001 --seed 1 --forward loss=0.02,delay=20,jitter=5 --reverse delay=20
+    python3 sender.py 5000 6000 input.txt 5000 200      # the sender talks to the proxy
+    python3 reciever.py 5001 5000 out.txt 0 0           # flp/rlp still work on top of it
+
+Each direction has its own impairments, given as key=value pairs:
+    loss=P                     Bernoulli loss
+    ge_p=P,ge_r=R              Gilbert-Elliott burst loss, P good->bad and R bad->good per packet,
+    ge_loss_good=L,ge_loss_bad=L    with the loss probability of each state (default 0 and 1)
+    delay=MS,jitter=MS         fixed delay plus a uniform +-jitter
+    reorder=P,reorder_delay=MS hold back a fraction of packets so later ones overtake them
+    duplicate=P                send a second copy
+    rate=KBIT,burst=BYTES,queue=BYTES   token bucket bandwidth cap with a drop-tail queue
+Every random draw comes from a generator seeded with --seed, so a run with the same
+traffic sees the same losses.
+'''
+
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import random
+import selectors
+import signal
+import socket
+import sys
+import time
+
+BUFFERSIZE = 1 << 16
+SPEC_KEYS = {"loss", "ge_p", "ge_r", "ge_loss_good", "ge_loss_bad", "delay", "jitter", "reorder",
+             "reorder_delay", "duplicate", "rate", "burst", "queue"}
+
+
+class Bernoulli:
+    def __init__(self, p: float, rng) -> None:
+        '''every packet is lost with probability p, independently of the others'''
+        self.p = p
+        self.rng = rng
+
+    def lost(self) -> bool:
+        return self.rng.random() < self.p
+
+
+class GilbertElliott:
+    def __init__(self, p: float, r: float, rng, loss_good: float = 0.0, loss_bad: float = 1.0) -> None:
+        '''
+        Two-state burst loss model, evaluated once per packet
+        :param p: probability of moving from the good to the bad state
+        :param r: probability of moving from the bad back to the good state
+        :param loss_good: loss probability in the good state
+        :param loss_bad: loss probability in the bad state
+        '''
+        self.p = p
+        self.r = r
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.rng = rng
+        self.bad = False
+
+    def lost(self) -> bool:
+        if self.bad:
+            self.bad = self.rng.random() >= self.r
+        else:
+            self.bad = self.rng.random() < self.p
+        return self.rng.random() < (self.loss_bad if self.bad else self.loss_good)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, queue: int) -> None:
+        '''
+        Bandwidth cap, packets wait for tokens in a FIFO queue and are dropped when it is full
+        :param rate: bytes per second
+        :param burst: bucket depth in bytes
+        :param queue: bytes that may wait for tokens
+        '''
+        self.rate = rate
+        self.burst = burst
+        self.queue = queue
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.backlog = 0.0  # bytes ahead in the queue at self.updated, owed tokens
+
+    def departure(self, now: float, size: int):
+        '''the time the packet leaves the bucket, or None if the queue is full'''
+        elapsed = now - self.updated
+        self.updated = now
+        # tokens first pay off the queue, whatever is left refills the bucket
+        earned = elapsed * self.rate
+        paid = min(earned, self.backlog)
+        self.backlog -= paid
+        self.tokens = min(self.burst, self.tokens + earned - paid)
+        if self.backlog == 0 and self.tokens >= size:
+            self.tokens -= size
+            return now
+        if self.backlog + size > self.queue:
+            return None
+        self.backlog += size - self.tokens
+        self.tokens = 0.0
+        return now + self.backlog / self.rate
+
+
+class Impairment:
+    def __init__(self, spec: dict, seed: int) -> None:
+        '''
+        Everything that happens to one direction of traffic
+        :param spec: parsed key=value pairs, see the module docstring
+        :param seed: seed of this direction's random generator
+        '''
+        self.rng = random.Random(seed)
+        if "ge_p" in spec or "ge_r" in spec:
+            self.loss = GilbertElliott(spec.get("ge_p", 0.0), spec.get("ge_r", 1.0), self.rng,
+                                       spec.get("ge_loss_good", 0.0), spec.get("ge_loss_bad", 1.0))
+        else:
+            self.loss = Bernoulli(spec.get("loss", 0.0), self.rng)
+        self.delay = spec.get("delay", 0.0) / 1000
+        self.jitter = spec.get("jitter", 0.0) / 1000
+        self.reorder = spec.get("reorder", 0.0)
+        self.reorder_delay = spec.get("reorder_delay", 10.0) / 1000
+        self.duplicate = spec.get("duplicate", 0.0)
+        self.bucket = None
+        if "rate" in spec:
+            rate = spec["rate"] * 1000 / 8
+            self.bucket = TokenBucket(rate, int(spec.get("burst", 16 * 1024)), int(spec.get("queue", 64 * 1024)))
+        self.stats = {"packets": 0, "lost": 0, "queue_drops": 0, "duplicated": 0, "reordered": 0, "delivered": 0}
+
+    def schedule(self, now: float, size: int):
+        '''delivery times for one packet, empty if it is lost and two if it is duplicated'''
+        self.stats["packets"] += 1
+        if self.loss.lost():
+            self.stats["lost"] += 1
+            return []
+        copies = 1
+        if self.duplicate and self.rng.random() < self.duplicate:
+            self.stats["duplicated"] += 1
+            copies = 2
+        times = []
+        for _ in range(copies):
+            sent = now
+            if self.bucket is not None:
+                sent = self.bucket.departure(now, size)
+                if sent is None:
+                    self.stats["queue_drops"] += 1
+                    continue
+            delay = self.delay
+            if self.jitter:
+                delay = max(0.0, delay + self.rng.uniform(-self.jitter, self.jitter))
+            if self.reorder and self.rng.random() < self.reorder:
+                self.stats["reordered"] += 1
+                delay += self.reorder_delay
+            times.append(sent + delay)
+        self.stats["delivered"] += len(times)
+        return times
+
+
+class ChannelProxy:
+    def __init__(self, listen_port: int, receiver_port: int, forward: Impairment, reverse: Impairment,
+                 address: str = "127.0.0.1") -> None:
+        '''
+        Relay datagrams between senders and the receiver through two Impairments
+        Each sender gets its own upstream socket, so a --multi receiver still tells them apart.
+        :param listen_port: the port senders send to
+        :param receiver_port: where the receiver listens
+        '''
+        self.receiver_address = (address, int(receiver_port))
+        self.forward = forward
+        self.reverse = reverse
+        self.selector = selectors.DefaultSelector()
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listen_socket.bind((address, int(listen_port)))
+        self.listen_socket.setblocking(False)
+        self.selector.register(self.listen_socket, selectors.EVENT_READ, None)
+        self.upstream = {}  # sender address -> socket towards the receiver
+        self.pending = []  # heap of (due, tie breaker, socket, data, destination)
+        self.counter = itertools.count()
+
+    def run(self, duration: float = None) -> None:
+        '''relay until duration seconds have passed, or forever'''
+        deadline = None if duration is None else time.monotonic() + duration
+        while deadline is None or time.monotonic() < deadline:
+            timeout = None
+            if self.pending:
+                timeout = max(0.0, self.pending[0][0] - time.monotonic())
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic()) if timeout is None else min(timeout, deadline - time.monotonic())
+            for key, _ in self.selector.select(timeout):
+                self.drain(key.fileobj, key.data)
+            now = time.monotonic()
+            while self.pending and self.pending[0][0] <= now:
+                _, _, sock, data, destination = heapq.heappop(self.pending)
+                try:
+                    sock.sendto(data, destination)
+                except OSError as e:
+                    logging.debug(f"channel could not deliver to {destination}: {e}")
+
+    def drain(self, sock, sender) -> None:
+        '''read everything queued on sock, sender is None for the listening socket'''
+        while True:
+            try:
+                data, address = sock.recvfrom(BUFFERSIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            now = time.monotonic()
+            if sender is None:
+                out, destination, impairment = self.upstream_for(address), self.receiver_address, self.forward
+            else:
+                out, destination, impairment = self.listen_socket, sender, self.reverse
+            for due in impairment.schedule(now, len(data)):
+                heapq.heappush(self.pending, (due, next(self.counter), out, data, destination))
+
+    def upstream_for(self, sender):
+        sock = self.upstream.get(sender)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((self.receiver_address[0], 0))
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, sender)
+            self.upstream[sender] = sock
+        return sock
+
+    def summary(self) -> dict:
+        return {"forward": self.forward.stats, "reverse": self.reverse.stats}
+
+
+def parse_spec(text: str) -> dict:
+    '''"loss=0.1,delay=20" -> {"loss": 0.1, "delay": 20.0}'''
+    spec = {}
+    for item in filter(None, text.split(",")):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key not in SPEC_KEYS:
+            raise ValueError(f"unknown channel option {key!r}, expected one of {sorted(SPEC_KEYS)}")
+        spec[key] = float(value)
+    return spec
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.DEBUG,
+        format='%(asctime)s,%(msecs)03d %(levelname)-8s %(message)s',
+        datefmt='%Y-%m-%d:%H:%M:%S')
+
+    parser = argparse.ArgumentParser(description="python3 channel.py listen_port receiver_port [--forward SPEC] [--reverse SPEC]",
+                                     epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("listen_port", type=int, help="port the sender sends to")
+    parser.add_argument("receiver_port", type=int, help="port the receiver listens on")
+    parser.add_argument("--forward", type=parse_spec, default={}, help="impairments from sender to receiver")
+    parser.add_argument("--reverse", type=parse_spec, default={}, help="impairments from receiver to sender")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random draws, the reverse direction uses seed + 1")
+    parser.add_argument("--duration", type=float, default=None, help="exit after this many seconds")
+    args = parser.parse_args()
+
+    proxy = ChannelProxy(args.listen_port, args.receiver_port, Impairment(args.forward, args.seed),
+                         Impairment(args.reverse, args.seed + 1))
+    # SIGTERM from a harness ends the run like Ctrl-C, the summary is still printed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        proxy.run(args.duration)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    # the counters go to stdout so a harness can read them
+    print(json.dumps(proxy.summary()))
@@ -0,0 +1,113 @@
+
+'''Pluggable congestion control for the sender, every window is in bytes'''
+
+import time
+
+
+class FixedWindow:
+    name = "fixed"
+
+    def __init__(self, mss: int, max_win: int) -> None:
+        '''
+        No congestion control, the sender may always fill max_win
+        :param mss: payload bytes per segment
+        :param max_win: the sender's maximum window, an upper bound for every algorithm
+        '''
+        self.mss = mss
+        self.max_win = max_win
+        self.cwnd = max_win
+        self.ssthresh = max_win
+
+    def window(self) -> int:
+        '''bytes the sender may have in flight right now'''
+        return max(self.mss, min(self.cwnd, self.max_win))
+
+    def on_ack(self, acked: int, rtt: float = None) -> None:
+        '''new data acknowledged cumulatively'''
+
+    def on_loss(self) -> None:
+        '''a loss found by duplicate ACKs or SACK, called once per recovery episode'''
+
+    def on_timeout(self) -> None:
+        '''the retransmission timer expired'''
+
+
+class Reno(FixedWindow):
+    name = "reno"
+
+    def __init__(self, mss: int, max_win: int) -> None:
+        '''slow start, additive increase and multiplicative decrease with fast recovery'''
+        super().__init__(mss, max_win)
+        self.cwnd = min(4 * mss, max_win)
+        self.ssthresh = max_win
+
+    def on_ack(self, acked: int, rtt: float = None) -> None:
+        if self.cwnd < self.ssthresh:
+            # slow start, one MSS per MSS acknowledged
+            self.cwnd += min(acked, self.mss)
+        else:
+            # congestion avoidance, about one MSS per round trip
+            self.cwnd += max(1, self.mss * self.mss // self.cwnd)
+        self.cwnd = min(self.cwnd, self.max_win)
+
+    def on_loss(self) -> None:
+        # fast recovery, halve and carry on from there
+        self.ssthresh = max(self.cwnd // 2, 2 * self.mss)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self) -> None:
+        self.ssthresh = max(self.cwnd // 2, 2 * self.mss)
+        self.cwnd = self.mss
+
+
+class Cubic(Reno):
+    name = "cubic"
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, mss: int, max_win: int) -> None:
+        '''
+        CUBIC window growth (RFC 8312) in congestion avoidance, Reno-style slow start
+        The window follows C*(t - K)^3 + W_max in segments, t being the time since the last loss.
+        '''
+        super().__init__(mss, max_win)
+        self.w_max = 0.0  # window in segments before the last reduction
+        self.epoch_start = None
+        self.k = 0.0
+
+    def on_ack(self, acked: int, rtt: float = None) -> None:
+        if self.cwnd < self.ssthresh:
+            super().on_ack(acked, rtt)
+            return
+        now = time.monotonic()
+        if self.epoch_start is None:
+            self.epoch_start = now
+            cwnd_segments = self.cwnd / self.mss
+            if cwnd_segments < self.w_max:
+                self.k = ((self.w_max - cwnd_segments) / self.C) ** (1 / 3)
+            else:
+                self.k = 0.0
+                self.w_max = cwnd_segments
+        t = now - self.epoch_start + (rtt or 0.0)
+        target = (self.C * (t - self.k) ** 3 + self.w_max) * self.mss
+        if target > self.cwnd:
+            # close the gap to the cubic curve over one window's worth of ACKs
+            self.cwnd += max(1, int((target - self.cwnd) * acked / self.cwnd))
+        else:
+            self.cwnd += max(1, self.mss * acked // (100 * self.cwnd))
+        self.cwnd = min(self.cwnd, self.max_win)
+
+    def on_loss(self) -> None:
+        self.epoch_start = None
+        self.w_max = self.cwnd / self.mss
+        self.ssthresh = max(int(self.cwnd * self.BETA), 2 * self.mss)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self) -> None:
+        self.epoch_start = None
+        self.w_max = self.cwnd / self.mss
+        self.ssthresh = max(int(self.cwnd * self.BETA), 2 * self.mss)
+        self.cwnd = self.mss
+
+
+CONGESTION_CONTROLS = {cc.name: cc for cc in (FixedWindow, Reno, Cubic)}
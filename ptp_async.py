@@ -0,0 +1,204 @@
+
+'''
+asyncio engine for the sender and receiver
+The PTP state machine is the one in sender.py and reciever.py, these classes only replace
+the blocking parts (the listen thread, wait_until and the receive loop) with
+asyncio.DatagramProtocol callbacks and loop timers, so one process can run many transfers:
+
+    await asyncio.gather(send_file(5000, 6000, "a.txt", 5000, 200),
+                         send_file(5001, 6001, "b.txt", 5000, 200))
+'''
+
+import asyncio
+import logging
+import time
+
+from ptp_log import SegmentLogger
+from ptp_timer import LoopTimers  # call_later timers with the TimerService interface
+from sender import Sender, CONTROL_TIMER
+from reciever import Receiver
+
+MAX_TRIES = 4  # SYN and FIN attempts before giving up with a RESET, as in Sender.run
+
+
+class AsyncSender(Sender, asyncio.DatagramProtocol):
+    def __init__(self, *args, **kwargs) -> None:
+        '''takes the same arguments as Sender, wait_mode is not used'''
+        super().__init__(*args, **kwargs)
+        self.state = "closed"  # "syn", "data", "fin", then "closed" again
+        self.transport = None
+        self.done = None
+        self.payloads_done = False
+        self.pacing_handle = None
+
+    async def transfer(self) -> bool:
+        '''
+        Connect, send the file and close
+        :return: False if the receiver never answered the SYN
+        '''
+        loop = asyncio.get_running_loop()
+        self.done = loop.create_future()
+        self.timers = LoopTimers(loop)
+        self.log = SegmentLogger(self.log_file, self.log_mode, self.log_sample)
+        self.reset_state()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, sock=self.sender_socket)
+        self.state = "syn"
+        self.send_syn()
+        self.start_control_timer()
+        try:
+            return await self.done
+        finally:
+            self.stats.enter("closed")
+            self.report_counters()
+            self.timers.stop()
+            if self.pacing_handle is not None:
+                self.pacing_handle.cancel()
+            self.transport.close()
+            self.log.close()
+
+    def datagram_received(self, data, addr) -> None:
+        if self.state == "closed":
+            return
+        self.receive_ack(data)
+        if self.state == "syn" and self.session_refused():
+            self.timers.cancel(CONTROL_TIMER)
+            self.send_reset()
+            self.finish(False)
+        elif self.state == "syn" and self.connection_secured:
+            self.timers.cancel(CONTROL_TIMER)
+            self.state = "data"
+            self.start_data()
+            if self.deflater is not None:
+                loop = asyncio.get_running_loop()
+                self.deflater.notify = lambda: loop.call_soon_threadsafe(self.resume_filling)
+            self.fill_window()
+        elif self.state == "data":
+            self.fill_window()
+        elif self.state == "fin" and not self.connection_secured:
+            self.timers.cancel(CONTROL_TIMER)
+            self.finish(True)
+
+    def error_received(self, exc) -> None:
+        # e.g. ICMP port unreachable before the receiver is up, the timers resend anyway
+        logging.debug(f"sender socket error: {exc}")
+
+    def fill_window(self) -> None:
+        '''send new segments while the window allows, then the FIN once everything is acked'''
+        if self.pacing_handle is not None:
+            return
+        while not self.payloads_done and self.window_open():
+            delay = self.pacing_delay()
+            if delay > 0:
+                self.pacing_handle = asyncio.get_running_loop().call_later(delay, self.resume_pacing)
+                return
+            payloads = self.next_batch(block=False)
+            if payloads is None:
+                # the compression stage calls resume_filling once it has more
+                return
+            if not payloads:
+                self.payloads_done = True
+                self.flush_parity()
+                break
+            self.send_new_segments(payloads)
+        if self.payloads_done and not self.window:
+            self.state = "fin"
+            self.send_fin()
+            self.start_control_timer()
+
+    def resume_pacing(self) -> None:
+        self.pacing_handle = None
+        if self.state == "data":
+            self.fill_window()
+
+    def resume_filling(self) -> None:
+        if self.state == "data":
+            self.fill_window()
+
+    def on_control_timeout(self) -> None:
+        '''resend the SYN or FIN, and give up with a RESET after MAX_TRIES attempts'''
+        self.rtt.backoff()
+        if self.state == "syn":
+            if self.syn_try < MAX_TRIES:
+                self.send_syn()
+                self.start_control_timer()
+            else:
+                logging.debug("Connection failed, not sending file")
+                self.send_reset()
+                self.finish(False)
+        elif self.state == "fin":
+            if self.fin_try < MAX_TRIES:
+                self.send_fin()
+                self.start_control_timer()
+            else:
+                self.send_reset()
+                self.finish(True)
+
+    def finish(self, connected: bool) -> None:
+        self.state = "closed"
+        self._is_active = False
+        if not self.done.done():
+            self.done.set_result(connected)
+
+
+class AsyncReceiver(Receiver, asyncio.DatagramProtocol):
+    def __init__(self, *args, **kwargs) -> None:
+        '''takes the same arguments as Receiver except gro, datagram_received cannot split coalesced datagrams'''
+        super().__init__(*args, **kwargs)
+        if self.gro:
+            raise ValueError("UDP_GRO needs the thread engine")
+        self.transport = None
+        self.done = None
+        self.ack_handle = None
+
+    async def serve(self) -> None:
+        '''receive one file, returns after the FIN or a RESET'''
+        loop = asyncio.get_running_loop()
+        self.done = loop.create_future()
+        self.start()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, sock=self.receiver_socket)
+        try:
+            await self.done
+        finally:
+            if self.ack_handle is not None:
+                self.ack_handle.cancel()
+            self.transport.close()
+            self.finish()
+
+    def datagram_received(self, data, addr) -> None:
+        if self.link_delay:
+            asyncio.get_running_loop().call_later(self.link_delay / 1000, self.deliver, data, addr)
+        else:
+            self.deliver(data, addr)
+
+    def error_received(self, exc) -> None:
+        logging.debug(f"receiver socket error: {exc}")
+
+    def deliver(self, message, address) -> None:
+        if self.done.done():
+            return
+        self.incoming_message, self.sender_address = message, address
+        if not self.process_segment():
+            self.done.set_result(True)
+        elif self.ack_deadline is not None and self.ack_handle is None:
+            self.ack_handle = asyncio.get_running_loop().call_later(self.ack_delay / 1000, self.ack_timeout)
+
+    def ack_timeout(self) -> None:
+        '''send the coalesced ACK, or wait on if it was sent and a newer one is held back'''
+        self.ack_handle = None
+        if self.done.done() or self.ack_deadline is None:
+            return
+        wait = self.ack_deadline - time.monotonic()
+        if wait > 0:
+            self.ack_handle = asyncio.get_running_loop().call_later(wait, self.ack_timeout)
+        else:
+            self.flush_ack()
+
+
+async def send_file(*args, **kwargs) -> bool:
+    '''send one file with an AsyncSender, arguments as for Sender'''
+    return await AsyncSender(*args, **kwargs).transfer()
+
+
+async def receive_file(*args, **kwargs) -> None:
+    '''receive one file with an AsyncReceiver, arguments as for Receiver'''
+    await AsyncReceiver(*args, **kwargs).serve()
@@ -0,0 +1,199 @@
+
+'''
+Streaming compression of the payload, agreed in the SYN with OPT_COMPRESS
+The sender compresses the file as one stream and cuts it into MSS-sized payloads, the
+receiver decompresses the stream as it becomes contiguous. Each side does this in its own
+thread, so neither the sender's ACK handling nor the receiver's ACKs wait on the codec.
+bz2 and lzma are optional in some Python builds and only offered where they import.
+'''
+
+import logging
+import queue
+import zlib
+from threading import Thread, Lock
+
+CODECS = {"zlib": 1}  # name -> id in OPT_COMPRESS
+try:
+    import bz2
+    CODECS["bz2"] = 2
+except ImportError:
+    bz2 = None
+try:
+    import lzma
+    CODECS["lzma"] = 3
+except ImportError:
+    lzma = None
+CODEC_NAMES = {codec_id: name for name, codec_id in CODECS.items()}
+# corrupt data raises zlib.error, OSError from bz2 or LZMAError
+DECOMPRESS_ERRORS = (zlib.error, OSError, EOFError) + ((lzma.LZMAError,) if lzma is not None else ())
+READ_SIZE = 1 << 16  # bytes of the file handed to the compressor at a time
+QUEUE_DEPTH = 256  # compressed payloads the sender's stage may run ahead
+
+
+def compressor(codec: str):
+    if codec == "bz2":
+        return bz2.BZ2Compressor()
+    if codec == "lzma":
+        return lzma.LZMACompressor()
+    return zlib.compressobj()
+
+
+class Passthrough:
+    '''stands in for a decompressor when the stream only has to be read in order, e.g. a session'''
+    def decompress(self, data) -> bytes:
+        return bytes(data)
+
+
+def decompressor(codec: str):
+    if codec is None:
+        return Passthrough()
+    if codec == "bz2":
+        return bz2.BZ2Decompressor()
+    if codec == "lzma":
+        return lzma.LZMADecompressor()
+    return zlib.decompressobj()
+
+
+class CompressionStage:
+    def __init__(self, chunks, codec: str, mss: int, counters: dict = None) -> None:
+        '''
+        Compress chunks in a thread into payloads of mss bytes, only the last one may be shorter
+        :param chunks: iterable of the file's bytes in order, e.g. iter_payloads
+        :param counters: the sender's counters, raw_bytes counts what went into the compressor
+        '''
+        self.mss = mss
+        self.counters = counters if counters is not None else {"raw_bytes": 0}
+        self.queue = queue.Queue(QUEUE_DEPTH)
+        self.lock = Lock()
+        self.waiting = False
+        self.notify = None  # called from the stage's thread when a take(block=False) found nothing
+        self.stopped = False
+        self.ended = False
+        self.thread = Thread(target=self.run, args=(chunks, codec), name="ptp-compress")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, chunks, codec) -> None:
+        stream = compressor(codec)
+        pending = bytearray()
+        try:
+            for chunk in chunks:
+                self.counters["raw_bytes"] += len(chunk)
+                pending += stream.compress(chunk)
+                while len(pending) >= self.mss and not self.stopped:
+                    self.put(bytes(pending[:self.mss]))
+                    del pending[:self.mss]
+                if self.stopped:
+                    return
+            pending += stream.flush()
+            for offset in range(0, len(pending), self.mss):
+                self.put(bytes(pending[offset:offset + self.mss]))
+            self.put(None)
+        except OSError as e:
+            # e.g. the file could not be read, the consumer raises it
+            self.put(e)
+
+    def put(self, item) -> None:
+        self.queue.put(item)
+        with self.lock:
+            if self.waiting:
+                self.waiting = False
+                if self.notify is not None:
+                    self.notify()
+
+    def take(self, count: int, block: bool = True):
+        '''
+        Up to count payloads, whatever is ready once the first one is
+        :return: [] at the end of the stream, None when block is False and nothing is ready yet
+        '''
+        if self.ended:
+            return []
+        payloads = []
+        while len(payloads) < count:
+            try:
+                if block and not payloads:
+                    item = self.queue.get()
+                else:
+                    with self.lock:
+                        # under the lock, a put() after this either is seen here or sees waiting
+                        item = self.queue.get_nowait()
+            except queue.Empty:
+                if payloads:
+                    break
+                with self.lock:
+                    if self.queue.empty():
+                        self.waiting = True
+                        return None
+                continue
+            if isinstance(item, Exception):
+                raise item
+            if item is None:
+                self.ended = True
+                break
+            payloads.append(item)
+        return payloads
+
+    def close(self) -> None:
+        '''stop a stage whose transfer ended early, its thread may be blocked on a full queue'''
+        self.stopped = True
+        with self.lock:
+            self.notify = None
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class DecompressionStage:
+    def __init__(self, codec: str, spool, output, counters: dict = None) -> None:
+        '''
+        Decompress the received stream in a thread, in order, as it becomes contiguous
+        :param codec: a name of CODECS, None passes the stream on as it is
+        :param spool: OutputWriter with the compressed stream at its offsets, as it arrived
+        :param output: OutputWriter for the decompressed file, written front to back
+        :param counters: the receiver's counters, raw_bytes counts the decompressed bytes
+        '''
+        self.spool = spool
+        self.output = output
+        self.counters = counters if counters is not None else {"raw_bytes": 0}
+        self.stream = decompressor(codec)
+        self.queue = queue.Queue()
+        self.written = 0
+        self.failed = False
+        self.thread = Thread(target=self.run, name="ptp-decompress")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def feed(self, offset: int, length: int) -> None:
+        '''the compressed bytes at offset are now contiguous with everything before them'''
+        self.queue.put((offset, length))
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if not self.failed:
+                self.inflate(self.spool.read_at(*item))
+        if not self.failed and hasattr(self.stream, "flush"):
+            self.write(self.stream.flush())
+
+    def inflate(self, data) -> None:
+        try:
+            self.write(self.stream.decompress(data))
+        except DECOMPRESS_ERRORS as e:
+            logging.debug(f"decompression failed at {self.written} bytes: {e}")
+            self.failed = True
+
+    def write(self, data) -> None:
+        if data:
+            self.output.write_at(self.written, data)
+            self.written += len(data)
+            self.counters["raw_bytes"] += len(data)
+
+    def close(self) -> int:
+        '''wait for everything fed so far, returns the length of the decompressed file'''
+        self.queue.put(None)
+        self.thread.join()
+        return self.written
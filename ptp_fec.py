@@ -0,0 +1,123 @@
+
+'''
+Forward error correction with XOR parity
+The sender follows every group of K consecutive new DATA segments with one FEC segment,
+whose sequence number is that of the group's first segment and whose payload is
+
+    count (1 byte), count segment lengths (2 bytes each), XOR of the payloads
+
+with every payload padded with zeros to the longest one. A receiver holding all but one
+segment of a group rebuilds the missing one from the parity and the others, without
+waiting for a retransmission. Retransmissions are never covered by parity.
+'''
+
+import struct
+
+FEC_XOR = 1  # the scheme byte of OPT_FEC, the second byte is the group size
+MAX_GROUP = 64
+MAX_PENDING = 256  # parity groups a receiver keeps while two or more of their segments are missing
+
+
+def parity_overhead(group: int) -> int:
+    '''bytes an FEC payload may have beyond the longest DATA payload of its group'''
+    return 1 + 2 * group
+
+
+def xor_payloads(payloads, lengths, width: int) -> int:
+    '''XOR of the payloads as one big-endian integer of width bytes, shorter ones zero padded at the end'''
+    acc = 0
+    for payload, length in zip(payloads, lengths):
+        acc ^= int.from_bytes(payload, "big") << (8 * (width - length))
+    return acc
+
+
+class FecEncoder:
+    def __init__(self, group: int) -> None:
+        '''
+        Parity for the sender's new segments
+        :param group: DATA segments covered by each FEC segment
+        '''
+        self.group = group
+        self.first_seq = None
+        self.payloads = []
+
+    def add(self, seq: int, payload):
+        '''feed one new segment, returns (first seq, FEC payload) once its group is full, else None'''
+        if not self.payloads:
+            self.first_seq = seq
+        self.payloads.append(payload)
+        if len(self.payloads) == self.group:
+            return self.flush()
+        return None
+
+    def flush(self):
+        '''parity of a partly filled group, e.g. at the end of the file, None if it is empty'''
+        if not self.payloads:
+            return None
+        lengths = [len(payload) for payload in self.payloads]
+        width = max(lengths)
+        parity = xor_payloads(self.payloads, lengths, width).to_bytes(width, "big")
+        self.payloads = []
+        return self.first_seq, bytes((len(lengths),)) + struct.pack(f"!{len(lengths)}H", *lengths) + parity
+
+
+class FecDecoder:
+    def __init__(self, space) -> None:
+        '''
+        Parity groups the receiver may still need
+        :param space: the SeqSpace of the negotiated header
+        '''
+        self.space = space
+        self.groups = {}  # first seq -> (seqs, lengths, parity)
+        self.members = {}  # seq of every segment of a kept group -> first seq of the group
+
+    def add(self, first_seq: int, data) -> bool:
+        '''keep one FEC payload, False if it is malformed'''
+        if not data or len(data) < parity_overhead(data[0]):
+            return False
+        count = data[0]
+        lengths = struct.unpack_from(f"!{count}H", data, 1)
+        parity = bytes(data[parity_overhead(count):])
+        if not count or len(parity) != max(lengths) or first_seq in self.groups:
+            return False
+        seqs = []
+        seq = first_seq
+        for length in lengths:
+            seqs.append(seq)
+            seq = self.space.add(seq, length)
+        if len(self.groups) >= MAX_PENDING:
+            self.forget(next(iter(self.groups)))
+        self.groups[first_seq] = (seqs, lengths, parity)
+        for seq in seqs:
+            self.members[seq] = first_seq
+        return True
+
+    def forget(self, first_seq: int) -> None:
+        seqs, _, _ = self.groups.pop(first_seq)
+        for seq in seqs:
+            if self.members.get(seq) == first_seq:
+                del self.members[seq]
+
+    def recover(self, seq: int, reassembly, read):
+        '''
+        Check the group seq belongs to, once all of it has arrived it is dropped
+        :param reassembly: the ReassemblyBuffer, tells which segments arrived and where they are
+        :param read: read(offset, length) returns bytes already written to the output file
+        :return: (seq, payload) of the segment rebuilt from the parity, or None
+        '''
+        first_seq = self.members.get(seq)
+        if first_seq is None:
+            return None
+        seqs, lengths, parity = self.groups[first_seq]
+        missing = [i for i, member in enumerate(seqs) if not reassembly.received(member)]
+        if len(missing) > 1:
+            return None
+        self.forget(first_seq)
+        if not missing:
+            return None
+        lost = missing[0]
+        others = [i for i in range(len(seqs)) if i != lost]
+        width = len(parity)
+        acc = int.from_bytes(parity, "big") ^ xor_payloads(
+            [read(reassembly.offset_of(seqs[i]), lengths[i]) for i in others], [lengths[i] for i in others], width)
+        return seqs[lost], acc.to_bytes(width, "big")[:lengths[lost]]
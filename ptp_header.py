@@ -0,0 +1,46 @@
+
+'''
+PTP segment header, a 2-byte type followed by the sequence (or ACK) number
+Version 1 is the original 16-bit sequence number. Version 2 widens it to 32 bits and is
+only used once both ends agreed to it in the SYN exchange; the SYN and the ACK of the SYN
+are always version 1.
+'''
+
+import struct
+
+from seqnum import SeqSpace
+
+TYPE_DATA, TYPE_ACK, TYPE_SYN, TYPE_FIN, TYPE_RESET, TYPE_FEC = range(6)
+MAX_UDP_PAYLOAD = 65507  # largest IPv4 UDP datagram payload
+DEFAULT_MSS = 1000
+
+
+class HeaderFormat:
+    def __init__(self, seq_format: str) -> None:
+        '''
+        :param seq_format: struct code of the sequence number, "H" or "I"
+        '''
+        self.struct = struct.Struct("!H" + seq_format)
+        self.size = self.struct.size
+        self.seq = SeqSpace(8 * struct.calcsize(seq_format))
+        self.block = struct.Struct("!" + 2 * seq_format)  # one SACK block, (start, end)
+        # a segment may move the sequence number by at most half its space, or ACKs compare wrongly
+        self.max_mss = min(MAX_UDP_PAYLOAD - self.size, 1 << (self.seq.bits - 1))
+
+    def pack(self, segment_type: int, seq: int) -> bytes:
+        return self.struct.pack(segment_type, seq)
+
+    def unpack(self, segment) -> tuple:
+        '''(type, seq) of a segment, the payload starts at self.size'''
+        return self.struct.unpack_from(segment)
+
+    def pack_blocks(self, blocks) -> bytes:
+        return b''.join(self.block.pack(start, end) for start, end in blocks)
+
+    def unpack_blocks(self, data):
+        return self.block.iter_unpack(data[:len(data) - len(data) % self.block.size])
+
+
+HEADER_V1 = HeaderFormat("H")
+HEADER_V2 = HeaderFormat("I")
+HEADER_FORMATS = {1: HEADER_V1, 2: HEADER_V2}  # keyed by the version negotiated with OPT_VERSION
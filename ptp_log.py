@@ -0,0 +1,83 @@
+
+import logging
+from threading import Thread, Condition
+
+LOG_MODES = ("full", "sampled", "off")
+
+
+class SegmentLogger:
+    def __init__(self, filename: str, mode: str = "full", sample_every: int = 100,
+                 flush_interval: float = 0.05, batch_size: int = 256) -> None:
+        '''
+        Buffered writer for Sender_log.txt/Receiver_log.txt
+        Records are queued as tuples on the hot path and only formatted by a background
+        thread, which writes them in batches through one file handle that stays open.
+        :param filename: the log file, truncated when the logger is created
+        :param mode: "full" logs every segment, "sampled" one in sample_every, "off" nothing
+        :param sample_every: the sampling period used in "sampled" mode
+        :param flush_interval: the longest a record waits in memory before being written, in seconds
+        :param batch_size: wake the writer early once this many records are queued
+        '''
+        if mode not in LOG_MODES:
+            raise ValueError(f"log mode must be one of {LOG_MODES}, not {mode!r}")
+        self.mode = mode
+        self.sample_every = max(1, int(sample_every))
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._count = 0
+        self._records = []
+        self._cond = Condition()
+        self._closed = False
+        self._file = open(filename, "w")
+        self._debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        self._writer = Thread(target=self._drain, name="ptp-log")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def log(self, action: str, elapsed: float, packet_type: str, seq_num: int, length: int) -> None:
+        '''
+        Queue one log line, e.g. log("snd", time.time() - start_time, "DATA", 4204, 1000)
+        :param elapsed: seconds since the connection started, rounded to 2 places when written
+        '''
+        if self.mode != "full":
+            if self.mode == "off":
+                return
+            self._count += 1
+            if self._count % self.sample_every:
+                return
+        with self._cond:
+            self._records.append((action, elapsed, packet_type, seq_num, length))
+            if len(self._records) >= self.batch_size:
+                self._cond.notify()
+
+    def close(self) -> None:
+        '''write out everything still queued and close the file'''
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+        self._file.close()
+
+    def _drain(self) -> None:
+        while True:
+            with self._cond:
+                # wait for a full batch, the flush interval or close, whichever comes first
+                self._cond.wait_for(lambda: self._closed or len(self._records) >= self.batch_size,
+                                    self.flush_interval)
+                records, self._records = self._records, []
+                closed = self._closed
+            if records:
+                self._file.write("".join(self._format(record) for record in records))
+                self._file.flush()
+            if closed:
+                return
+
+    def _format(self, record) -> str:
+        action, elapsed, packet_type, seq_num, length = record
+        elapsed = round(elapsed, 2)
+        if self._debug:
+            logging.debug("%s\t\t%s\t\t%s\t\t%s\t\t%s", action, elapsed, packet_type, seq_num, length)
+        return (action.ljust(7) + str(elapsed).ljust(7) + packet_type.ljust(7)
+                + str(seq_num).ljust(7) + str(length).ljust(7) + "\n")
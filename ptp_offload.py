@@ -0,0 +1,90 @@
+
+'''
+Linux UDP segmentation offload
+With UDP_SEGMENT (GSO) one sendmsg hands the kernel back to back datagrams of gso_size
+bytes each, only the last may be shorter, and the kernel splits them into separate
+datagrams. With UDP_GRO a receiving socket may get several datagrams of one flow in a
+single buffer, with their size in a control message. Python has no sendmmsg/recvmmsg,
+so these are the batched paths; both need Linux 5.0 or newer and callers fall back to
+one datagram per syscall when they are missing.
+'''
+
+import socket
+import struct
+import sys
+
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GRO = getattr(socket, "UDP_GRO", 104)
+MAX_GSO_SEGMENTS = 64  # UDP_MAX_SEGMENTS of older kernels, newer ones allow 128
+MAX_GSO_BYTES = 65507  # the whole batch is still one UDP datagram for the socket layer
+GRO_BUFFER = 1 << 16
+
+
+def gso_supported(sock) -> bool:
+    '''whether the kernel knows UDP_SEGMENT on this socket'''
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+    except OSError:
+        return False
+    return True
+
+
+def gso_runs(segments, gso_size: int):
+    '''
+    Split (header, payload) pairs into runs one GSO send can carry
+    Every segment of a run is gso_size bytes except possibly the last one.
+    '''
+    limit = max(1, min(MAX_GSO_SEGMENTS, MAX_GSO_BYTES // gso_size))
+    run = []
+    for header, payload in segments:
+        run.append((header, payload))
+        if len(header) + len(payload) != gso_size or len(run) == limit:
+            yield run
+            run = []
+    if run:
+        yield run
+
+
+def send_gso(sock, run, gso_size: int, address) -> None:
+    '''send one run from gso_runs with a single sendmsg'''
+    buffers = [part for segment in run for part in segment]
+    if len(run) == 1:
+        sock.sendmsg(buffers, (), 0, address)
+    else:
+        sock.sendmsg(buffers, [(SOL_UDP, UDP_SEGMENT, struct.pack("=H", gso_size))], 0, address)
+
+
+def enable_gro(sock) -> bool:
+    '''ask for coalesced receives, returns False where the kernel does not support it'''
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+    except OSError:
+        return False
+    return True
+
+
+def recv_gro(sock, bufsize: int = GRO_BUFFER):
+    '''
+    One recvmsg on a socket with UDP_GRO enabled
+    :return: (list of datagrams, sender address), several when the kernel coalesced them
+    '''
+    data, ancdata, _, address = sock.recvmsg(bufsize, socket.CMSG_SPACE(4))
+    for level, kind, value in ancdata:
+        if level == SOL_UDP and kind == UDP_GRO:
+            size = struct.unpack("=i", value[:4])[0]
+            if 0 < size < len(data):
+                return [data[offset:offset + size] for offset in range(0, len(data), size)], address
+    return [data], address
+
+
+def recv_datagrams(sock, bufsize: int, gro: bool = False):
+    '''one receive call, through recv_gro when gro is enabled on sock, else a plain recvfrom'''
+    if gro:
+        return recv_gro(sock)
+    message, address = sock.recvfrom(bufsize)
+    return [message], address
@@ -0,0 +1,36 @@
+
+'''
+Options negotiated in the SYN exchange
+The sender appends the options it wants after the ISN of its SYN and the receiver echoes
+the ones it accepts after the ACK number of its reply. Peers that do not know about options
+never read past the first 4 bytes, so old senders and receivers still interoperate.
+Each option is encoded as kind (1 byte), length of the value (1 byte), value.
+'''
+
+OPT_SACK = 1  # selective acknowledgement blocks follow the cumulative ACK number
+OPT_VERSION = 2  # 1 byte, the header version (see ptp_header) used after the handshake
+OPT_MSS = 3  # 2 bytes, payload bytes per DATA segment
+OPT_FEC = 4  # 2 bytes, the parity scheme and the DATA segments per FEC segment (see ptp_fec)
+OPT_COMPRESS = 5  # 1 byte, the codec the payload stream is compressed with (see ptp_compress)
+OPT_SESSION = 6  # 8 bytes of session id, the reply adds where to resume (see ptp_session)
+
+
+def encode_options(options: dict) -> bytes:
+    '''{kind: value bytes} -> wire format'''
+    encoded = bytearray()
+    for kind, value in options.items():
+        encoded += bytes((kind, len(value))) + value
+    return bytes(encoded)
+
+
+def decode_options(data) -> dict:
+    '''wire format -> {kind: value bytes}, a truncated trailing option is ignored'''
+    options = {}
+    i = 0
+    while i + 2 <= len(data):
+        kind, length = data[i], data[i + 1]
+        if i + 2 + length > len(data):
+            break
+        options[kind] = bytes(data[i + 2:i + 2 + length])
+        i += 2 + length
+    return options
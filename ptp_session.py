@@ -0,0 +1,207 @@
+
+'''
+Multi-file sessions and resumable transfers, agreed in the SYN with OPT_SESSION
+The payload stream of a session is every file in turn, each one preceded by a frame header
+
+    index (4 bytes), name length (2 bytes), file size (8 bytes), start offset (8 bytes), UTF-8 name
+
+and followed by the file's bytes from the start offset on. The receiver writes each file into
+the output directory and keeps a checkpoint of the bytes it holds contiguously per file. A
+sender offering the same session id again (same names, sizes and modification times) is told
+the first incomplete file and how much of it already arrived, and starts from there.
+'''
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+
+FRAME = struct.Struct("!IHQQ")
+CHECKPOINT_NAME = ".ptp-checkpoint"  # in the output directory
+CHECKPOINT_EVERY = 1 << 20  # bytes written between checkpoints while a file is open
+RESUME = struct.Struct("!8sIQ")  # the receiver's reply: session id, file index, offset in that file
+READ_SIZE = 1 << 16
+
+
+class SessionSource:
+    def __init__(self, paths) -> None:
+        '''
+        The files a sender transfers in one session, in order
+        :param paths: files and directories, a directory adds every file below it by its relative path
+        '''
+        self.entries = []  # (name, path, size)
+        digest = hashlib.blake2b(digest_size=8)
+        for path in paths:
+            if os.path.isdir(path):
+                found = []
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    found += [os.path.join(root, name) for name in sorted(files)]
+                named = [(os.path.relpath(found_path, path), found_path) for found_path in found]
+            else:
+                named = [(os.path.basename(path), path)]
+            for name, found_path in named:
+                stat = os.stat(found_path)
+                name = name.replace(os.sep, "/")
+                self.entries.append((name, found_path, stat.st_size))
+                digest.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        names = [name for name, _, _ in self.entries]
+        if len(set(names)) != len(names):
+            raise ValueError("two files of the session have the same name")
+        self.id = digest.digest()
+
+    def pieces(self, index: int = 0, offset: int = 0):
+        '''the session stream from file index at offset on, as frame headers and file slices'''
+        for i, (name, path, size) in enumerate(self.entries[index:], index):
+            start = offset if i == index else 0
+            encoded = name.encode()
+            yield FRAME.pack(i, len(encoded), size, start) + encoded
+            if start >= size:
+                continue
+            with open(path, "rb") as f:
+                # the views keep the mapping alive after the file is closed
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            for position in range(start, size, READ_SIZE):
+                yield view[position:min(position + READ_SIZE, size)]
+
+
+def rechunk(pieces, size: int):
+    '''cut a stream given as consecutive buffers into payloads of size bytes, copying only across buffers'''
+    carry = b""
+    for piece in pieces:
+        view = memoryview(piece)
+        start = 0
+        if carry:
+            start = min(size - len(carry), len(view))
+            carry += bytes(view[:start])
+            if len(carry) < size:
+                continue
+            yield carry
+            carry = b""
+        while len(view) - start >= size:
+            yield view[start:start + size]
+            start += size
+        carry = bytes(view[start:])
+    if carry:
+        yield carry
+
+
+def load_checkpoint(directory: str, session_id: bytes):
+    '''the per-file [name, size, received] entries saved for session_id, [] for any other session'''
+    try:
+        with open(os.path.join(directory, CHECKPOINT_NAME)) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if saved.get("session") != session_id.hex():
+        return []
+    return saved.get("files", [])
+
+
+def resume_point(entries):
+    '''(file index, offset) to continue from, the first file not received completely'''
+    for index, (_, size, received) in enumerate(entries):
+        if received < size:
+            return index, received
+    return len(entries), 0
+
+
+class SessionWriter:
+    def __init__(self, directory: str, session_id: bytes, entries) -> None:
+        '''
+        Unpack the session stream into files below directory, fed in order like an OutputWriter
+        :param entries: the checkpoint of a resumed session, see load_checkpoint
+        '''
+        self.directory = directory
+        self.session_id = session_id
+        self.entries = [list(entry) for entry in entries]
+        self.position = 0  # stream bytes consumed
+        self.header = b""  # a frame header split across writes
+        self.fd = None
+        self.entry = None
+        self.file_offset = 0  # where the next byte of the current file goes
+        self.checkpointed = 0
+        self.failed = False
+        os.makedirs(directory, exist_ok=True)
+
+    def write_at(self, offset: int, data) -> None:
+        if offset != self.position or self.failed:
+            # only ever fed in order, anything else means the stream is broken
+            self.failed = True
+            return
+        self.position += len(data)
+        view = memoryview(data)
+        while len(view) and not self.failed:
+            if self.fd is None:
+                view = self.read_header(view)
+                continue
+            size = self.entry[1]
+            take = min(len(view), size - self.file_offset)
+            os.pwrite(self.fd, view[:take], self.file_offset)
+            self.file_offset += take
+            self.entry[2] = self.file_offset
+            view = view[take:]
+            if self.file_offset == size:
+                self.close_file()
+            elif self.file_offset - self.checkpointed >= CHECKPOINT_EVERY:
+                self.save()
+
+    def read_header(self, view):
+        '''consume a frame header from view, return what is left of it'''
+        if len(self.header) < FRAME.size:
+            needed = FRAME.size - len(self.header)
+        else:
+            # the fixed part is complete, the name follows
+            needed = FRAME.size + FRAME.unpack_from(self.header)[1] - len(self.header)
+        self.header += bytes(view[:needed])
+        view = view[needed:]
+        if len(self.header) < FRAME.size:
+            return view
+        index, name_length, size, start = FRAME.unpack_from(self.header)
+        if len(self.header) < FRAME.size + name_length:
+            return view
+        name = self.header[FRAME.size:].decode(errors="replace")
+        self.header = b""
+        self.open_file(index, name, size, start)
+        return view
+
+    def open_file(self, index: int, name: str, size: int, start: int) -> None:
+        path = os.path.normpath(os.path.join(self.directory, name))
+        if os.path.isabs(name) or not path.startswith(os.path.normpath(self.directory) + os.sep):
+            logging.debug(f"refusing session file name {name!r}")
+            self.failed = True
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        flags = os.O_RDWR | os.O_CREAT | (os.O_TRUNC if start == 0 else 0)
+        self.fd = os.open(path, flags, 0o644)
+        del self.entries[index:]
+        self.entry = [name, size, start]
+        self.entries.append(self.entry)
+        self.file_offset = start
+        self.checkpointed = start
+        if start >= size:
+            self.close_file()
+
+    def close_file(self) -> None:
+        os.ftruncate(self.fd, self.entry[1])
+        os.close(self.fd)
+        self.fd = None
+        logging.debug(f"session file {self.entry[0]} complete, {self.entry[1]} bytes")
+        self.save()
+
+    def save(self) -> None:
+        '''write the checkpoint, replaced atomically so a killed receiver leaves the old or the new one'''
+        self.checkpointed = self.file_offset
+        path = os.path.join(self.directory, CHECKPOINT_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"session": self.session_id.hex(), "files": self.entries}, f)
+        os.replace(path + ".tmp", path)
+
+    def close(self, length: int = None) -> None:
+        '''save the checkpoint, a file cut short keeps the bytes that arrived'''
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.save()
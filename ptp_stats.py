@@ -0,0 +1,155 @@
+
+'''
+Per-connection statistics of the sender and receiver
+The summary and the periodic snapshots are plain JSON, see --stats and --snapshots.
+'''
+
+import json
+import time
+from bisect import bisect_left
+from threading import Thread, Event
+
+RTT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)  # upper bounds
+
+
+class TransferStats:
+    def __init__(self, role: str, estimator=None) -> None:
+        '''
+        Counters, RTT histogram and time spent in each connection state of one endpoint
+        The hot paths only do dict increments; increments from different threads are not
+        locked, so under heavy contention a count can be off by a few.
+        :param role: "sender" or "receiver", copied into every summary
+        :param estimator: the sender's RtoEstimator, its current SRTT, RTTVAR and RTO go into every summary
+        '''
+        self.role = role
+        self.estimator = estimator
+        self.started = time.monotonic()
+        self.counters = dict.fromkeys(COUNTERS[role], 0)
+        self.rtt_histogram = [0] * (len(RTT_BUCKETS_MS) + 1)
+        self.rtt_count = 0
+        self.rtt_total = 0.0
+        self.rtt_min = None
+        self.rtt_max = None
+        self.state = None
+        self.state_since = self.started
+        self.time_in_state = {}
+        self.timings = {}  # name -> [calls, total seconds, max seconds], filled by instrument()
+        self.hooks = []
+        self._snapshots = None
+
+    def rtt(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.rtt_histogram[bisect_left(RTT_BUCKETS_MS, ms)] += 1
+        self.rtt_count += 1
+        self.rtt_total += ms
+        if self.rtt_min is None or ms < self.rtt_min:
+            self.rtt_min = ms
+        if self.rtt_max is None or ms > self.rtt_max:
+            self.rtt_max = ms
+
+    def enter(self, state: str) -> None:
+        '''switch the connection state, the time spent in the previous one is added up'''
+        if state == self.state:
+            return
+        now = time.monotonic()
+        if self.state is not None:
+            self.time_in_state[self.state] = self.time_in_state.get(self.state, 0.0) + now - self.state_since
+        self.state = state
+        self.state_since = now
+
+    def add_hook(self, hook) -> None:
+        '''hook(name, seconds) is called after every instrumented call, see instrument()'''
+        self.hooks.append(hook)
+
+    def instrument(self, obj, names) -> None:
+        '''
+        Time every call of the given methods of obj, e.g. instrument(sender, ["receive_ack"])
+        The bound methods are replaced on the instance only, nothing is timed unless this is called.
+        '''
+        for name in names:
+            setattr(obj, name, self._timed(name, getattr(obj, name)))
+
+    def _timed(self, name, method):
+        record = self.timings.setdefault(name, [0, 0.0, 0.0])
+        hooks = self.hooks
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                took = clock() - start
+                record[0] += 1
+                record[1] += took
+                if took > record[2]:
+                    record[2] = took
+                for hook in hooks:
+                    hook(name, took)
+        return timed
+
+    def snapshot(self) -> dict:
+        '''the current values as a JSON-ready dict'''
+        now = time.monotonic()
+        time_in_state = dict(self.time_in_state)
+        if self.state is not None:
+            time_in_state[self.state] = time_in_state.get(self.state, 0.0) + now - self.state_since
+        labels = [f"<={bound}ms" for bound in RTT_BUCKETS_MS] + [f">{RTT_BUCKETS_MS[-1]}ms"]
+        summary = {
+            "role": self.role,
+            "elapsed": round(now - self.started, 6),
+            "state": self.state,
+            "counters": dict(self.counters),
+            "rtt_ms": {
+                "samples": self.rtt_count,
+                "min": self.rtt_min,
+                "mean": self.rtt_total / self.rtt_count if self.rtt_count else None,
+                "max": self.rtt_max,
+                "histogram": {label: n for label, n in zip(labels, self.rtt_histogram) if n},
+            },
+            "time_in_state": {state: round(seconds, 6) for state, seconds in time_in_state.items()},
+            "timings": {name: {"calls": calls, "total_s": round(total, 6), "max_s": round(longest, 6),
+                               "mean_us": round(total / calls * 1e6, 3) if calls else None}
+                        for name, (calls, total, longest) in self.timings.items()},
+        }
+        if self.estimator is not None:
+            summary["rto"] = self.estimator.snapshot()
+        return summary
+
+    def start_snapshots(self, filename: str, interval: float) -> None:
+        '''append a snapshot as one JSON line to filename every interval seconds until stop_snapshots()'''
+        stop = Event()
+        out = open(filename, "w")
+
+        def write():
+            while not stop.wait(interval):
+                out.write(json.dumps(self.snapshot()) + "\n")
+                out.flush()
+            out.close()
+        thread = Thread(target=write, name="ptp-stats")
+        thread.daemon = True
+        thread.start()
+        self._snapshots = (stop, thread)
+
+    def stop_snapshots(self) -> None:
+        if self._snapshots is not None:
+            stop, thread = self._snapshots
+            stop.set()
+            thread.join()
+            self._snapshots = None
+
+    def write_summary(self, filename: str) -> None:
+        self.stop_snapshots()
+        with open(filename, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+            f.write("\n")
+
+
+COUNTERS = {
+    "sender": ("segments_sent", "send_calls", "bytes_sent", "retransmissions", "timeouts",
+               "fast_retransmits", "sack_retransmits", "acks_received", "duplicate_acks",
+               "syn_sent", "fin_sent", "fec_sent", "raw_bytes"),
+    "receiver": ("segments_received", "recv_calls", "data_segments", "bytes_received", "out_of_order",
+                 "duplicates", "dropped_segments", "acks_sent", "acks_coalesced", "dropped_acks",
+                 "fec_received", "fec_recovered", "raw_bytes"),
+}
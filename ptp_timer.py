@@ -0,0 +1,119 @@
+
+import heapq  # deadlines are kept in a min-heap
+import itertools
+import time
+from threading import Thread, Condition
+
+
+class TimerService:
+    def __init__(self, name: str = "ptp-timer") -> None:
+        '''
+        One background thread that fires callbacks at their deadlines
+        Each timer is identified by a key (e.g. a segment's sequence number), scheduling
+        an existing key re-arms it, and cancelled entries are dropped lazily from the heap.
+        :param name: the name of the timer thread, useful in debug output
+        '''
+        self._cond = Condition()
+        self._heap = []  # [deadline, tie breaker, key, callback, active]
+        self._entries = {}  # key -> live heap entry
+        self._counter = itertools.count()
+        self._running = True
+        self._thread = Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def schedule(self, key, delay: float, callback) -> None:
+        '''(re-)arm the timer for key to call callback() after delay seconds'''
+        with self._cond:
+            old = self._entries.get(key)
+            if old is not None:
+                old[4] = False
+            entry = [time.monotonic() + delay, next(self._counter), key, callback, True]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            # only wake the thread if the new deadline is now the earliest
+            if self._heap[0] is entry:
+                self._cond.notify()
+
+    def cancel(self, key) -> bool:
+        '''stop the timer for key, returns whether one was pending'''
+        with self._cond:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            entry[4] = False
+            return True
+
+    def cancel_all(self) -> None:
+        with self._cond:
+            for entry in self._entries.values():
+                entry[4] = False
+            self._entries.clear()
+            self._heap.clear()
+
+    def stop(self) -> None:
+        '''cancel every timer and let the thread exit'''
+        with self._cond:
+            self._running = False
+            self._entries.clear()
+            self._heap.clear()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running:
+                    # drop cancelled entries sitting at the top of the heap
+                    while self._heap and not self._heap[0][4]:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+                entry = heapq.heappop(self._heap)
+                entry[4] = False
+                del self._entries[entry[2]]
+                callback = entry[3]
+            # run outside the lock so the callback may re-arm timers
+            callback()
+
+
+class LoopTimers:
+    def __init__(self, loop) -> None:
+        '''
+        The TimerService interface on top of an asyncio event loop, callbacks run on the loop
+        :param loop: the running event loop
+        '''
+        self._loop = loop
+        self._handles = {}  # key -> asyncio.TimerHandle
+
+    def schedule(self, key, delay: float, callback) -> None:
+        '''(re-)arm the timer for key to call callback() after delay seconds'''
+        old = self._handles.pop(key, None)
+        if old is not None:
+            old.cancel()
+        self._handles[key] = self._loop.call_later(delay, self._fire, key, callback)
+
+    def cancel(self, key) -> bool:
+        handle = self._handles.pop(key, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        return True
+
+    def cancel_all(self) -> None:
+        for handle in self._handles.values():
+            handle.cancel()
+        self._handles.clear()
+
+    def stop(self) -> None:
+        self.cancel_all()
+
+    def _fire(self, key, callback) -> None:
+        del self._handles[key]
+        callback()
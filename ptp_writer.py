@@ -0,0 +1,55 @@
+
+import os
+
+
+class OutputWriter:
+    def __init__(self, filename: str, preallocate: int = 0) -> None:
+        '''
+        The received file, opened once and written at each segment's offset
+        :param filename: truncated on open
+        :param preallocate: reserve this many bytes up front so the file does not grow segment by segment
+        '''
+        self.filename = filename
+        self.fd = os.open(filename, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.size = 0  # end of the furthest byte written
+        self.preallocated = 0
+        if preallocate > 0:
+            try:
+                os.posix_fallocate(self.fd, 0, preallocate)
+            except (AttributeError, OSError):
+                # not every platform/filesystem supports fallocate, a sparse file still avoids regrowth
+                os.ftruncate(self.fd, preallocate)
+            self.preallocated = preallocate
+
+    def write_at(self, offset: int, data) -> None:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(self.fd, data, offset)
+        else:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            written = os.write(self.fd, data)
+        if written < len(data):
+            # short writes are rare on regular files, finish the rest
+            self.write_at(offset + written, memoryview(data)[written:])
+            return
+        self.size = max(self.size, offset + len(data))
+
+    def read_at(self, offset: int, length: int) -> bytes:
+        '''read back bytes already written, e.g. to rebuild a segment from parity'''
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, length, offset)
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        return os.read(self.fd, length)
+
+    def close(self, length: int = None) -> None:
+        '''
+        :param length: the final size of the file, by default the end of the furthest write;
+                       anything preallocated beyond it is cut off
+        '''
+        if self.fd is None:
+            return
+        if length is None:
+            length = self.size
+        if self.preallocated > length or length < self.size:
+            os.ftruncate(self.fd, length)
+        os.close(self.fd)
+        self.fd = None
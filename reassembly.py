@@ -0,0 +1,83 @@
+
+from seqnum import SEQ_BITS, seq_add, seq_diff
+
+
+class ReassemblyBuffer:
+    def __init__(self, expected: int, window: int, bits: int = SEQ_BITS) -> None:
+        '''
+        Tracks which segments have arrived, keyed by sequence number and aware of wraparound
+        Payloads are not kept here, every accepted segment gets its offset in the stream so
+        it can be written straight to its place in the output file.
+        :param expected: the next in-order sequence number (ISN + 1 after the SYN)
+        :param window: the receive window in bytes, segments starting further ahead are refused
+        :param bits: the width of the sequence space, the window must be below half of it
+        '''
+        if window > (1 << (bits - 1)):
+            raise ValueError(f"a {window} byte window is ambiguous in a {bits}-bit sequence space")
+        self.expected = expected
+        self.window = window
+        self.bits = bits
+        self.delivered = 0  # bytes received contiguously, i.e. the stream offset of expected
+        self.segments = {}  # seq -> length, only ever holds segments ahead of expected
+        self.buffered_bytes = 0
+        self.duplicates = 0
+
+    def offer(self, seq: int, length: int):
+        '''
+        Accept one DATA segment of length bytes
+        :return: its offset in the stream, or None for duplicate and out-of-window segments
+        '''
+        ahead = seq_diff(seq, self.expected, self.bits)
+        if ahead < 0 or seq in self.segments:
+            self.duplicates += 1
+            return None
+        if ahead >= self.window:
+            return None
+        offset = self.delivered + ahead
+        if ahead > 0:
+            self.segments[seq] = length
+            self.buffered_bytes += length
+            return offset
+
+        # in order, advance past it and every buffered segment it makes contiguous
+        self.advance(length)
+        while self.expected in self.segments:
+            length = self.segments.pop(self.expected)
+            self.buffered_bytes -= length
+            self.advance(length)
+        return offset
+
+    def blocks(self, limit: int):
+        '''
+        Up to limit (start, end) ranges of contiguous segments held beyond expected, lowest first
+        '''
+        if not self.segments:
+            return []
+        order = sorted(self.segments, key=lambda seq: seq_diff(seq, self.expected, self.bits))
+        blocks = []
+        start = end = None
+        for seq in order:
+            if seq != end:
+                if start is not None:
+                    blocks.append((start, end))
+                    if len(blocks) == limit:
+                        return blocks
+                start = seq
+            end = seq_add(seq, self.segments[seq], self.bits)
+        blocks.append((start, end))
+        return blocks
+
+    def received(self, seq: int) -> bool:
+        '''whether the segment starting at seq has arrived, in order or buffered'''
+        return seq_diff(seq, self.expected, self.bits) < 0 or seq in self.segments
+
+    def offset_of(self, seq: int) -> int:
+        '''stream offset of seq, behind or ahead of expected'''
+        return self.delivered + seq_diff(seq, self.expected, self.bits)
+
+    def advance(self, length: int) -> None:
+        self.expected = seq_add(self.expected, length, self.bits)
+        self.delivered += length
+
+    def __len__(self) -> int:
+        return len(self.segments)
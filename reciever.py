@@ -4,12 +4,42 @@ import logging, sys  # to write the log
 import socket  # Core lib, to send packet via UDP socket
 from threading import Thread  # (Optional)threading will make the timer easily implemented
 import random  # for flp and rlp function
+import os
+import argparse
+import asyncio
+import selectors  # readiness wait on the nonblocking socket
+from collections import deque
+
+from ptp_log import SegmentLogger, LOG_MODES  # buffered writer for Receiver_log.txt
+from reassembly import ReassemblyBuffer  # out-of-order segments keyed by sequence number
+from ptp_writer import OutputWriter  # writes each segment at its offset in the output file
+from ptp_options import (OPT_SACK, OPT_VERSION, OPT_MSS, OPT_FEC, OPT_COMPRESS, OPT_SESSION,
+                         encode_options, decode_options)
+from ptp_fec import FecDecoder, FEC_XOR, MAX_GROUP, parity_overhead  # rebuilds single losses per parity group
+from ptp_compress import DecompressionStage, CODEC_NAMES  # inflates the stream as it becomes contiguous
+from ptp_session import SessionWriter, RESUME, load_checkpoint, resume_point  # many files per connection
+from ptp_offload import enable_gro, recv_datagrams  # coalesced receives with UDP_GRO
+from ptp_stats import TransferStats  # counters and time in each state
+from ptp_header import (HEADER_V1, HEADER_FORMATS, DEFAULT_MSS, MAX_UDP_PAYLOAD,
+                        TYPE_ACK, TYPE_SYN, TYPE_FIN, TYPE_RESET, TYPE_FEC)
 
 BUFFERSIZE = 1024
+MAX_SACK_BLOCKS = 8  # SACK blocks reported per ACK, lowest first
+DEFAULT_RCV_WIN = {16: 32768, 32: 1 << 24}  # bytes, by sequence number width
+MAX_SOCKET_BUFFER = 1 << 26  # never ask the kernel for more than this much receive buffer
+TIME_WAIT = 10.0  # seconds a closed connection keeps answering retransmitted FINs
+EXPIRY_CHECK = 1.0  # seconds between scans for idle connections
+TIMED_METHODS = ("process_segment", "connect")
+SPOOL_SUFFIX = ".spool"  # the received stream of a compressed transfer or a session, removed at the end
 
 
 class Receiver:
-    def __init__(self, receiver_port: int, sender_port: int, filename: str, flp: float, rlp: float) -> None:
+    def __init__(self, receiver_port: int, sender_port: int, filename: str, flp: float, rlp: float,
+                 log_mode: str = "full", log_sample: int = 100, link_delay: float = 0,
+                 rcv_win: int = None, preallocate: int = 0, sack: bool = True,
+                 max_mss: int = None, max_version: int = 2, log_file: str = "Receiver_log.txt",
+                 sock: socket.socket = None, gro: bool = False, ack_every: int = 1, ack_delay: float = 10,
+                 fec: bool = True, compress: bool = True, session: bool = True) -> None:
         '''
         The server will be able to receive the file from the sender via UDP
         :param receiver_port: the UDP port number to be used by the receiver to receive PTP segments from the sender.
@@ -17,6 +47,24 @@ class Receiver:
         :param filename: the name of the text file into which the text sent by the sender should be stored
         :param flp: forward loss probability, which is the probability that any segment in the forward direction (Data, FIN, SYN) is lost.
         :param rlp: reverse loss probability, which is the probability of a segment in the reverse direction (i.e., ACKs) being lost.
+        :param log_mode: "full", "sampled" (one segment in log_sample) or "off" for Receiver_log.txt.
+        :param link_delay: milliseconds every incoming segment is held before being processed, emulating a slower link.
+        :param rcv_win: bytes beyond the next expected one that are accepted out of order, at most half the sequence space.
+                        None picks DEFAULT_RCV_WIN for the negotiated header.
+        :param preallocate: bytes to reserve for the output file before the transfer starts.
+        :param sack: accept the selective acknowledgement option when a sender asks for it.
+        :param max_mss: the largest MSS accepted from a sender, None allows up to the UDP maximum.
+        :param max_version: the newest header version accepted from a sender.
+        :param log_file: where the segment log is written.
+        :param sock: an already bound socket to reply on, ReceiverServer shares its own with every connection.
+        :param gro: receive with UDP_GRO where Linux supports it, several datagrams per syscall.
+        :param ack_every: acknowledge every Nth in-order segment, 1 sends an ACK for each one.
+        :param ack_delay: milliseconds a held back ACK may wait for more in-order segments.
+        :param fec: accept XOR parity segments when a sender asks for them.
+        :param compress: accept a compressed payload stream when a sender asks for it, it is
+                         spooled next to filename and decompressed into filename.
+        :param session: accept multi-file sessions, filename is then the directory the files go to
+                        and holds the checkpoint a reconnecting sender resumes from.
 
         '''
         self.address = "127.0.0.1"  # change it to 0.0.0.0 or public ipv4 address if want to test it between different computers
@@ -26,163 +74,525 @@ class Receiver:
         self.filename = filename
         self.flp = float(flp)
         self.rlp = float(rlp)
+        self.log_mode = log_mode
+        self.log_sample = log_sample
+        self.link_delay = float(link_delay)
+        self.rcv_win = None if rcv_win is None else int(rcv_win)
+        self.preallocate = int(preallocate)
+        self.sack = sack
+        self.max_mss = max_mss
+        self.max_version = max_version
+        self.log_file = log_file
+        self.ack_every = max(1, int(ack_every))
+        self.ack_delay = float(ack_delay)
+        self.fec = fec
+        self.compress = compress
+        self.session = session
+        # the SYN is always v1, the header and MSS change once the options are accepted
+        self.header = HEADER_V1
+        self.mss = DEFAULT_MSS
+        self.stats = TransferStats("receiver")
+        self.counters = self.stats.counters
 
         # init the UDP socket
         # define socket for the server side and bind address
+        if sock is not None:
+            self.receiver_socket = sock
+            self.gro = False  # the owner of the socket does the receiving
+            return
         logging.debug(f"The sender is using the address {self.server_address} to receive message!")
         self.receiver_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
         self.receiver_socket.bind(self.server_address)
+        self.gro = gro and enable_gro(self.receiver_socket)
         pass
 
     def run(self) -> None:
         '''
         This function contain the main logic of the receiver
         '''
-        self.buffer = []
-        self.seqs_received = []
-        open('Receiver_log.txt', 'w').close()
-        open('FileReceived.txt', 'w').close()
+        self.start()
+
+        # nonblocking socket, wake on readiness and drain everything queued
+        self.receiver_socket.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.receiver_socket, selectors.EVENT_READ)
+        delay = self.link_delay / 1000
+        in_transit = deque()  # (due time, message, address) held back by the emulated link delay
+        running = True
+        while running:
+            timeout = None
+            if in_transit:
+                timeout = max(0.0, in_transit[0][0] - time.time())
+            if self.ack_deadline is not None:
+                ack_wait = max(0.0, self.ack_deadline - time.monotonic())
+                timeout = ack_wait if timeout is None else min(timeout, ack_wait)
+            if selector.select(timeout):
+                arrived = time.time() + delay
+                while True:
+                    try:
+                        messages, address = recv_datagrams(self.receiver_socket, self.recv_size, self.gro)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    self.counters["recv_calls"] += 1
+                    for message in messages:
+                        in_transit.append((arrived, message, address))
+            now = time.time()
+            while running and in_transit and in_transit[0][0] <= now:
+                _, self.incoming_message, self.sender_address = in_transit.popleft()
+                running = self.process_segment()
+            if running and self.ack_deadline is not None and time.monotonic() >= self.ack_deadline:
+                self.flush_ack()
+        selector.close()
+        self.finish()
+
+    def start(self) -> None:
+        '''open the log and wait for a SYN'''
+        self.reassembly = None  # created from the ISN once the SYN arrives
+        self.accepted_options = {}
+        self.log = SegmentLogger(self.log_file, self.log_mode, self.log_sample)
+        self.output = None  # opened once the SYN says whether it is a file or a session directory
         self.start_time = time.time()
-        close_conn = False
+        self.close_conn = False
         self.connection_secured = False
         self.packet_lost = False
-        while True:
-            time.sleep(0.15)
-            randval = random.uniform(0.0, 1.0)
-            self.incoming_message, self.sender_address = self.receiver_socket.recvfrom(BUFFERSIZE)
-            seq_num_int = int.from_bytes(self.incoming_message[2:4], "big")
-
-            # If reset sent
-            if int.from_bytes(self.incoming_message[:2], "big") == 4:
-                with open("Receiver_log.txt", "a+") as logfile:
-                    logfile.write(f"rcv".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "RESET".ljust(7) + str(0).ljust(7) + str(0).ljust(7) + "\n")
-                logging.debug(f"snd\t\t{round((time.time() - self.start_time), 2)}\t\RESET\t\t0\t\t0")
-                exit()
-            # if segment not lost
-            elif randval >= self.flp:
-                # try to receive any incoming message from the sender
-                self.last_seq_received = self.incoming_message[2:4]
-                # if segment is SYN or FIN
-                if self.incoming_message[0:2] == (2).to_bytes(2, "big") or self.incoming_message[0:2] == (3).to_bytes(2, "big"):
-                    seq_num_int = int.from_bytes(self.incoming_message[2:4], "big")
-
-                    # If SYN
-                    if self.incoming_message[0:2] == (2).to_bytes(2, "big"):
-                        # If first packet has not been lost and timer has not started
-                        if not self.packet_lost:
-                            self.start_time = time.time()
-                        with open("Receiver_log.txt", "a+") as logfile:
-                            logfile.write("rcv".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "SYN".ljust(7) + str(seq_num_int).ljust(7) + str(0).ljust(7) + "\n")
-                        logging.debug(f"rcv\t\t{round((time.time() - self.start_time), 2)}\t\SYN\t\t{seq_num_int}\t\t{0}")
-                        self.connection_secured = True
-                    else:
-                        # Write to log
-                        with open("Receiver_log.txt", "a+") as logfile:
-                            logfile.write("rcv".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "FIN".ljust(7) + str(seq_num_int).ljust(7) + str(0).ljust(7) + "\n")
-                        logging.debug(f"rcv\t\t{round((time.time() - self.start_time), 2)}\t\FIN\t\t{seq_num_int}\t\t{0}")
-                        close_conn = True
-                    # If reply ACK has not been "lost"
-                    if randval >= self.rlp:
-                        reply_seqno = find_reply_seqno(self)
-                        self.expected_seq = reply_seqno
-                        typeACK = (1).to_bytes(2, byteorder='big', signed=False)
-                        reply_message = typeACK + reply_seqno
-                        send_ack(self, reply_message)
-                        if close_conn:
-                            exit()
-                else:
+        self.recv_size = BUFFERSIZE
+        self.fec_decoder = None  # set by connect() when parity was agreed
+        self.inflater = None  # set by connect() when compression or a session was agreed
+        self.inflated = 0  # stream bytes handed to the inflater
+        self.pending_ack = None  # (message, ack number) held back by ACK coalescing
+        self.held_acks = 0
+        self.ack_deadline = None  # time.monotonic() by which pending_ack goes out
+        self.stats.enter("listen")
 
-                    data = self.incoming_message[4:]
-                    # write to log
-                    with open("Receiver_log.txt", "a+") as logfile:
-                        logfile.write("rcv".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "DATA".ljust(7) + str(seq_num_int).ljust(7) + str(len(data)).ljust(7) + "\n")
-                    logging.debug(f"rcv\t\t{round((time.time() - self.start_time), 2)}\t\tDATA\t\t{seq_num_int}\t\t{len(data)}")
-
-                    # set data length for segments less than MSS
-                    if int.from_bytes(self.incoming_message[2:4], "big") - int.from_bytes(self.last_seq_received, "big") <= 1000:
-                        if self.incoming_message[2:4] not in self.seqs_received:
-                            with open(self.filename, "ab+") as file:
-                                file.write(self.incoming_message[4:])
-                            self.seqs_received.append(self.incoming_message[2:4])
-        
-                        data_length = len(self.incoming_message[4:])
-                    else:
-                        self.buffer.append(self.incoming_message)
-                    
-                    # reply "ACK" once receive any message from sender
-
-                    # segemnt has been skipped
-                    if self.incoming_message[2:4] != self.expected_seq:
-                        reply_seqno = int.from_bytes(self.last_seq_received, "big")
-                    
-                    # First segment has been skipped
-                    elif len(self.seqs_received) == 0 and int.from_bytes(self.incoming_message[2:4], "big") == int.from_bytes(self.last_seq_received, "big") + 1:
-                        reply_seqno = int.from_bytes(self.last_seq_received, "big")
-                    else:
-                        reply_seqno = int.from_bytes(self.incoming_message[2:4], "big") + data_length
-
-                    # roll value around back to 0 if greater tha 2^16 - 1
-                    if reply_seqno > 65535:
-                        reply_seqno = (reply_seqno - (65535) - 1).to_bytes(2, "big")
-                    else:
-                        reply_seqno = reply_seqno.to_bytes(2, "big")
-
-                    # send reply ack
-                    typeACK = (1).to_bytes(2, byteorder='big', signed=False)
-                    randval = random.uniform(0.0, 1.0)
-                    reply_message = typeACK + reply_seqno
-                    # check if dropping ack
-                    if randval >= self.rlp:
-                        send_ack(self, reply_message)
-                        self.expected_seq = reply_seqno
-                    else:
-                        # write dropped ack in log
-                        data = self.incoming_message[4:]
-                        seq_num_int = int.from_bytes(reply_seqno, "big")
-                        with open("Receiver_log.txt", "a+") as logfile:
-                            if not self.connection_secured:
-                                self.start_time = time.time()
-                            logfile.write("drp".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "ACK".ljust(7) + str(seq_num_int).ljust(7) + str(0).ljust(7) + "\n")
-                        logging.debug(f"drp\t\t{round((time.time() - self.start_time), 2)}\t\tACK\t\t{seq_num_int}\t\t{0}")
-            else:
-                # DATA has been dropped
-                val = int.from_bytes(self.incoming_message[2:4], "big")
-                data = self.incoming_message[4:]
-                with open("Receiver_log.txt", "a+") as logfile:
-                    if not self.connection_secured:
+    def finish(self) -> None:
+        '''trim the output file to the bytes received in order and flush the log'''
+        self.stats.enter("closed")
+        if self.counters["recv_calls"]:
+            logging.debug(f"received {self.counters['segments_received']} segments in {self.counters['recv_calls']} receive calls")
+        if self.inflater is not None:
+            # the stage reads the spool until everything fed to it is decompressed
+            length = self.inflater.close()
+            self.inflater.output.close(length)
+            if OPT_COMPRESS in self.accepted_options:
+                logging.debug(f"decompressed {self.reassembly.delivered} bytes to {length}")
+        if self.output is not None:
+            self.output.close(self.reassembly.delivered if self.reassembly is not None else 0)
+        if self.inflater is not None:
+            os.remove(self.output.filename)
+        self.log.close()
+
+    def negotiate(self, offered: dict) -> dict:
+        '''
+        Pick the SYN options this receiver supports
+        :return: the accepted options, echoed back in the ACK of the SYN
+        '''
+        accepted = {}
+        if OPT_SACK in offered and self.sack:
+            accepted[OPT_SACK] = b''
+        if OPT_VERSION in offered and offered[OPT_VERSION]:
+            version = offered[OPT_VERSION][0]
+            if version in HEADER_FORMATS and version <= self.max_version:
+                accepted[OPT_VERSION] = bytes([version])
+        if OPT_MSS in offered and len(offered[OPT_MSS]) == 2:
+            header = HEADER_FORMATS[accepted.get(OPT_VERSION, b'\x01')[0]]
+            mss = min(int.from_bytes(offered[OPT_MSS], "big"), self.max_mss or header.max_mss, header.max_mss)
+            if mss > 0:
+                # echo the MSS actually granted, the sender uses whatever comes back
+                accepted[OPT_MSS] = mss.to_bytes(2, "big")
+        if OPT_FEC in offered and self.fec and len(offered[OPT_FEC]) == 2:
+            scheme, group = offered[OPT_FEC]
+            if scheme == FEC_XOR and 0 < group <= MAX_GROUP:
+                accepted[OPT_FEC] = offered[OPT_FEC]
+        if OPT_COMPRESS in offered and self.compress and len(offered[OPT_COMPRESS]) == 1:
+            if offered[OPT_COMPRESS][0] in CODEC_NAMES:
+                accepted[OPT_COMPRESS] = offered[OPT_COMPRESS]
+        if OPT_SESSION in offered and self.session and len(offered[OPT_SESSION]) == 8:
+            # the reply tells the sender how far an earlier connection of the same session got
+            index, offset = resume_point(load_checkpoint(self.filename, offered[OPT_SESSION]))
+            accepted[OPT_SESSION] = RESUME.pack(offered[OPT_SESSION], index, offset)
+            if index or offset:
+                logging.debug(f"session resumes at file {index}, byte {offset}")
+        return accepted
+
+    def connect(self, isn: int) -> None:
+        '''apply the options accepted for the SYN with sequence number isn'''
+        self.header = HEADER_FORMATS[self.accepted_options.get(OPT_VERSION, b'\x01')[0]]
+        if OPT_MSS in self.accepted_options:
+            self.mss = int.from_bytes(self.accepted_options[OPT_MSS], "big")
+        window = self.rcv_win if self.rcv_win is not None else DEFAULT_RCV_WIN[self.header.seq.bits]
+        # the data starts where the SYN's ACK said, which wrapped in the v1 space
+        self.reassembly = ReassemblyBuffer(HEADER_V1.seq.add(isn, 1), window, self.header.seq.bits)
+        self.recv_size = max(BUFFERSIZE, self.header.size + self.mss)
+        if OPT_FEC in self.accepted_options:
+            self.fec_decoder = FecDecoder(self.header.seq)
+            self.recv_size += parity_overhead(self.accepted_options[OPT_FEC][1])
+        if OPT_SESSION in self.accepted_options:
+            session_id = self.accepted_options[OPT_SESSION][:8]
+            target = SessionWriter(self.filename, session_id, load_checkpoint(self.filename, session_id))
+        else:
+            target = OutputWriter(self.filename, self.preallocate)
+        if OPT_COMPRESS in self.accepted_options or OPT_SESSION in self.accepted_options:
+            # segments land in the spool at their stream offsets, the stage reads it in order
+            # and writes the file, or the session's files, itself
+            spool = OutputWriter(self.filename + SPOOL_SUFFIX)
+            codec = CODEC_NAMES.get(self.accepted_options.get(OPT_COMPRESS, b'\x00')[0])
+            self.inflater = DecompressionStage(codec, spool, target, self.counters)
+            self.output = spool
+        else:
+            self.output = target
+        # room in the kernel for a full window, otherwise bursts of large datagrams are dropped
+        wanted = min(window + 2 * self.recv_size, MAX_SOCKET_BUFFER)
+        if self.receiver_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < wanted:
+            try:
+                self.receiver_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, wanted)
+            except OSError:
+                logging.debug(f"could not raise SO_RCVBUF to {wanted} bytes")
+        self.stats.enter("established")
+
+    def process_segment(self) -> bool:
+        '''
+        Handle self.incoming_message from self.sender_address
+        :return: False once the connection is over (FIN acked or RESET received)
+        '''
+        randval = random.uniform(0.0, 1.0)
+        self.counters["segments_received"] += 1
+        if len(self.incoming_message) < 2:
+            return True
+        segment_type = int.from_bytes(self.incoming_message[:2], "big")
+
+        # If reset sent
+        if segment_type == TYPE_RESET:
+            self.log.log("rcv", time.time() - self.start_time, "RESET", 0, 0)
+            return False
+        # the SYN is always sent with the v1 header, the rest with the negotiated one
+        header = HEADER_V1 if segment_type == TYPE_SYN else self.header
+        if len(self.incoming_message) < header.size:
+            return True
+        _, seq_num_int = header.unpack(self.incoming_message)
+        data = self.incoming_message[header.size:]
+
+        # if segment not lost
+        if randval >= self.flp:
+            # if segment is SYN or FIN
+            if segment_type == TYPE_SYN or segment_type == TYPE_FIN:
+
+                # If SYN
+                if segment_type == TYPE_SYN:
+                    # If first packet has not been lost and timer has not started
+                    if not self.packet_lost:
                         self.start_time = time.time()
-                    logfile.write("drp".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "DATA".ljust(7) + str(val).ljust(7) + str(len(data)).ljust(7) + "\n")
-                logging.debug(f"drp\t\t{round((time.time() - self.start_time), 2)}\t\DATA\t\t{val}\t\t{len(data)}")
-                self.packet_lost = True
-                #logging.debug(f"snd\t\tDATA\t{seq_num_int}\t\t{len(data)}")
+                    self.log.log("rcv", time.time() - self.start_time, "SYN", seq_num_int, 0)
+                    if not self.connection_secured:
+                        self.accepted_options = self.negotiate(decode_options(data))
+                    reply_seqno = HEADER_V1.seq.add(seq_num_int, 1)
+                    reply_message = HEADER_V1.pack(TYPE_ACK, reply_seqno)
+                    # echo the options this receiver agreed to
+                    reply_message += encode_options(self.accepted_options)
+                else:
+                    # Write to log
+                    self.log.log("rcv", time.time() - self.start_time, "FIN", seq_num_int, 0)
+                    self.close_conn = True
+                    self.stats.enter("closing")
+                    # the ACK of the FIN covers anything still held back
+                    self.pending_ack = None
+                    self.ack_deadline = None
+                    reply_seqno = self.header.seq.add(seq_num_int, 1)
+                    reply_message = self.header.pack(TYPE_ACK, reply_seqno)
+                # If reply ACK has not been "lost"
+                if randval >= self.rlp:
+                    send_ack(self, reply_message, reply_seqno)
+                else:
+                    self.counters["dropped_acks"] += 1
+                # switch to the negotiated header only after the ACK of the SYN went out in v1
+                if segment_type == TYPE_SYN and not self.connection_secured:
+                    self.connect(seq_num_int)
+                    self.connection_secured = True
+                if self.close_conn and randval >= self.rlp:
+                    return False
+            elif segment_type == TYPE_FEC:
+                self.log.log("rcv", time.time() - self.start_time, "FEC", seq_num_int, len(data))
+                self.counters["fec_received"] += 1
+                # parity is only answered when it rebuilt a segment, otherwise it would look like a duplicate ACK
+                if (self.fec_decoder is not None and self.fec_decoder.add(seq_num_int, data)
+                        and self.rebuild(seq_num_int)):
+                    self.reply(*self.ack_message())
+            else:
+
+                # write to log
+                self.log.log("rcv", time.time() - self.start_time, "DATA", seq_num_int, len(data))
+                if self.reassembly is None:
+                    # no SYN seen yet, nothing to acknowledge against
+                    return True
+
+                # new segments go straight to their place in the file, in order or not
+                in_order = seq_num_int == self.reassembly.expected
+                no_gaps = not len(self.reassembly)
+                offset = self.reassembly.offer(seq_num_int, len(data))
+                self.counters["data_segments"] += 1
+                if offset is not None:
+                    self.output.write_at(offset, data)
+                    self.counters["bytes_received"] += len(data)
+                    if not in_order:
+                        self.counters["out_of_order"] += 1
+                else:
+                    self.counters["duplicates"] += 1
+                rebuilt = offset is not None and self.fec_decoder is not None and self.rebuild(seq_num_int)
+                if self.inflater is not None:
+                    self.inflate_delivered()
+
+                # cumulative ACK, repeated for gaps and duplicates so the sender sees them
+                reply_message, reply_seqno = self.ack_message()
+                # in-order data with no gap behind it may wait for the next segments, gaps,
+                # reordering and duplicates are answered at once so fast retransmit is not delayed
+                if in_order and no_gaps and not rebuilt and self.ack_every > 1:
+                    self.held_acks += 1
+                    if self.held_acks < self.ack_every:
+                        self.pending_ack = (reply_message, reply_seqno)
+                        if self.ack_deadline is None:
+                            self.ack_deadline = time.monotonic() + self.ack_delay / 1000
+                        self.counters["acks_coalesced"] += 1
+                        return True
+                self.reply(reply_message, reply_seqno)
+        else:
+            # DATA has been dropped
+            self.counters["dropped_segments"] += 1
+            if not self.connection_secured:
+                self.start_time = time.time()
+            self.log.log("drp", time.time() - self.start_time, "FEC" if segment_type == TYPE_FEC else "DATA",
+                         seq_num_int, len(data))
+            self.packet_lost = True
+            #logging.debug(f"snd\t\tDATA\t{seq_num_int}\t\t{len(data)}")
+        return True
+
+    def ack_message(self):
+        '''(message, ack number) of the cumulative ACK, with SACK blocks if they were agreed'''
+        reply_seqno = self.reassembly.expected
+        reply_message = self.header.pack(TYPE_ACK, reply_seqno)
+        if OPT_SACK in self.accepted_options:
+            # blocks already received beyond the cumulative ACK
+            reply_message += self.header.pack_blocks(self.reassembly.blocks(MAX_SACK_BLOCKS))
+        return reply_message, reply_seqno
+
+    def rebuild(self, seq: int) -> bool:
+        '''rebuild the segment missing from seq's parity group if it is the only one, True if it was'''
+        recovered = self.fec_decoder.recover(seq, self.reassembly, self.output.read_at)
+        if recovered is None:
+            return False
+        seq, payload = recovered
+        offset = self.reassembly.offer(seq, len(payload))
+        if offset is None:
+            return False
+        self.output.write_at(offset, payload)
+        self.counters["bytes_received"] += len(payload)
+        self.counters["fec_recovered"] += 1
+        self.log.log("rbd", time.time() - self.start_time, "DATA", seq, len(payload))
+        if self.inflater is not None:
+            self.inflate_delivered()
+        return True
 
-def send_ack(self, reply_message):
+    def inflate_delivered(self) -> None:
+        '''hand the part of the stream that just became contiguous to the decompression stage'''
+        delivered = self.reassembly.delivered
+        if delivered > self.inflated:
+            self.inflater.feed(self.inflated, delivered - self.inflated)
+            self.inflated = delivered
+
+    def reply(self, reply_message, reply_seqno) -> None:
+        '''send an ACK for DATA, or drop it with probability rlp, replacing any held back one'''
+        self.pending_ack = None
+        self.held_acks = 0
+        self.ack_deadline = None
+        # check if dropping ack
+        if random.uniform(0.0, 1.0) >= self.rlp:
+            send_ack(self, reply_message, reply_seqno)
+        else:
+            # write dropped ack in log
+            self.counters["dropped_acks"] += 1
+            if not self.connection_secured:
+                self.start_time = time.time()
+            self.log.log("drp", time.time() - self.start_time, "ACK", reply_seqno, 0)
+
+    def flush_ack(self) -> None:
+        '''send the ACK held back by coalescing once ack_delay is over'''
+        if self.pending_ack is not None:
+            self.reply(*self.pending_ack)
+        self.ack_deadline = None
+
+
+def send_ack(self, reply_message, ack_num):
     self.receiver_socket.sendto(reply_message,
                                 self.sender_address)
-    
-    seq_num_int = int.from_bytes(reply_message[2:4], "big")
-    data = reply_message[4:]
-    with open("Receiver_log.txt", "a+") as logfile:
-        logfile.write("snd".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "ACK".ljust(7) + str(seq_num_int).ljust(7) + str(len(data)).ljust(7) + "\n")
-    logging.debug(f"snd\t\t{round((time.time() - self.start_time), 2)}\t\tACK\t\t{seq_num_int}\t\t{len(data)}")
-    for message in self.buffer:
-        if seq_num_int == int.from_bytes(self.incoming_message[2:4], "big"):
-            break
-        with open(self.filename, "ab+") as file:
-            file.write(message[4:])
-        with open("Receiver_log.txt", "a+") as logfile:
-            logfile.write(f"just wrote to file from buffer\n")
-
-        self.last_seq_received = message[2:4]
-        self.buffer.remove(message)
-
-def find_reply_seqno(self):
-    reply_seqno = int.from_bytes(self.incoming_message[2:4], "big") + 1
-    if reply_seqno > 65535:
-        reply_seqno = (reply_seqno - (65535) - 1).to_bytes(2, "big")
-    else:
-        reply_seqno = reply_seqno.to_bytes(2, "big")
-        return reply_seqno
+    self.counters["acks_sent"] += 1
+
+    # options and SACK blocks are not data, the log keeps showing 0 bytes for every ACK
+    self.log.log("snd", time.time() - self.start_time, "ACK", ack_num, 0)
+
+
+class ReceiverServer:
+    def __init__(self, receiver_port: int, filename: str, flp: float, rlp: float, idle_timeout: float = 30.0,
+                 half_open_timeout: float = 5.0, connections: int = 0, link_delay: float = 0,
+                 log_file: str = "Receiver_log.txt", gro: bool = False, **options) -> None:
+        '''
+        One port shared by many senders at once, every connection gets its own Receiver
+        Connections are keyed by the sender's address and ISN, a SYN with a new ISN from the
+        same address starts a new connection and drops the old one.
+        :param filename: output file pattern, {host}, {port} and {isn} are filled in for each connection,
+                         without them "-{host}-{port}-{isn}" is added before the extension
+        :param idle_timeout: seconds without a segment before an established connection is dropped
+        :param half_open_timeout: seconds a connection may stay at the SYN, before any DATA or FIN arrives
+        :param connections: return from run() after this many connections have ended, 0 serves forever
+        :param link_delay: milliseconds every incoming segment is held, as for Receiver
+        :param log_file: log file pattern, filled in like filename
+        :param gro: receive with UDP_GRO where Linux supports it, several datagrams per syscall
+        :param options: passed on to every Receiver, e.g. log_mode, rcv_win or sack
+        '''
+        self.server_address = ("127.0.0.1", int(receiver_port))
+        self.filename = filename
+        self.flp = float(flp)
+        self.rlp = float(rlp)
+        self.idle_timeout = float(idle_timeout)
+        self.half_open_timeout = float(half_open_timeout)
+        self.connection_limit = int(connections)
+        self.link_delay = float(link_delay)
+        self.log_file = log_file
+        self.options = options
+        self.connections = {}  # (address, isn) -> Receiver
+        self.last_seen = {}  # (address, isn) -> time.monotonic() of its latest segment
+        self.by_address = {}  # address -> key of its newest connection, DATA and FIN carry no ISN
+        self.established = set()  # keys that got past the SYN, the rest are half-open
+        self.delayed = set()  # keys holding back a coalesced ACK
+        self.time_wait = {}  # address -> (isn, header, expiry) of connections closed by a FIN
+        self.ended = 0
+
+        logging.debug(f"The server is using the address {self.server_address} to receive message!")
+        self.receiver_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.receiver_socket.bind(self.server_address)
+        self.gro = gro and enable_gro(self.receiver_socket)
+
+    def run(self) -> None:
+        '''serve connections until connection_limit of them have ended'''
+        self.receiver_socket.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.receiver_socket, selectors.EVENT_READ)
+        delay = self.link_delay / 1000
+        in_transit = deque()  # (due time, message, address) held back by the emulated link delay
+        next_check = time.monotonic() + EXPIRY_CHECK
+        while not self.connection_limit or self.ended < self.connection_limit:
+            timeout = EXPIRY_CHECK if self.connections or self.time_wait else None
+            if in_transit:
+                timeout = min(timeout or EXPIRY_CHECK, max(0.0, in_transit[0][0] - time.time()))
+            if self.delayed:
+                ack_deadline = min(self.connections[key].ack_deadline for key in self.delayed)
+                timeout = min(timeout or EXPIRY_CHECK, max(0.0, ack_deadline - time.monotonic()))
+            if selector.select(timeout):
+                arrived = time.time() + delay
+                while True:
+                    try:
+                        messages, address = recv_datagrams(self.receiver_socket, MAX_UDP_PAYLOAD, self.gro)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    for message in messages:
+                        in_transit.append((arrived, message, address))
+            now = time.time()
+            while in_transit and in_transit[0][0] <= now:
+                _, message, address = in_transit.popleft()
+                self.dispatch(message, address)
+            for key in list(self.delayed):
+                connection = self.connections[key]
+                if connection.ack_deadline is None:
+                    self.delayed.discard(key)
+                elif connection.ack_deadline <= time.monotonic():
+                    connection.flush_ack()
+                    self.delayed.discard(key)
+            if time.monotonic() >= next_check:
+                self.expire(time.monotonic())
+                next_check = time.monotonic() + EXPIRY_CHECK
+        selector.close()
+        for key in list(self.connections):
+            self.close_connection(key, "server stopped")
+
+    def dispatch(self, message, address) -> None:
+        '''hand one segment to the connection it belongs to'''
+        if len(message) < HEADER_V1.size:
+            return
+        segment_type = int.from_bytes(message[:2], "big")
+        if segment_type == TYPE_SYN:
+            _, isn = HEADER_V1.unpack(message)
+            key = (address, isn)
+            if address in self.time_wait and self.time_wait[address][0] == isn:
+                # a late copy of the SYN of a connection that already closed
+                return
+            if key not in self.connections:
+                old = self.by_address.get(address)
+                if old is not None:
+                    self.close_connection(old, "replaced by a new SYN")
+                self.open_connection(key)
+        else:
+            key = self.by_address.get(address)
+            if key is None:
+                if segment_type == TYPE_FIN and address in self.time_wait:
+                    self.answer_fin(message, address)
+                return
+            self.established.add(key)
+        connection = self.connections[key]
+        self.last_seen[key] = time.monotonic()
+        connection.incoming_message, connection.sender_address = message, address
+        if not connection.process_segment():
+            self.close_connection(key, "closed")
+        elif connection.ack_deadline is not None:
+            self.delayed.add(key)
+
+    def open_connection(self, key) -> None:
+        address, isn = key
+        connection = Receiver(self.server_address[1], address[1], connection_filename(self.filename, address, isn),
+                              self.flp, self.rlp, log_file=connection_filename(self.log_file, address, isn),
+                              sock=self.receiver_socket, **self.options)
+        connection.start()
+        self.connections[key] = connection
+        self.last_seen[key] = time.monotonic()
+        self.by_address[address] = key
+        self.time_wait.pop(address, None)
+        logging.debug(f"connection from {address} with ISN {isn} opened")
+
+    def close_connection(self, key, reason: str) -> None:
+        address, isn = key
+        connection = self.connections.pop(key)
+        del self.last_seen[key]
+        self.established.discard(key)
+        self.delayed.discard(key)
+        if self.by_address.get(address) == key:
+            del self.by_address[address]
+        connection.finish()
+        if connection.close_conn:
+            self.time_wait[address] = (isn, connection.header, time.monotonic() + TIME_WAIT)
+        self.ended += 1
+        logging.debug(f"connection from {address} with ISN {isn} {reason}")
+
+    def answer_fin(self, message, address) -> None:
+        '''ACK a retransmitted FIN whose first ACK was lost after the connection closed'''
+        _, header, _ = self.time_wait[address]
+        if len(message) < header.size:
+            return
+        _, seq_num_int = header.unpack(message)
+        self.receiver_socket.sendto(header.pack(TYPE_ACK, header.seq.add(seq_num_int, 1)), address)
+
+    def expire(self, now: float) -> None:
+        '''drop idle and half-open connections and finished TIME_WAIT entries'''
+        for key, seen in list(self.last_seen.items()):
+            limit = self.idle_timeout if key in self.established else self.half_open_timeout
+            if now - seen > limit:
+                self.close_connection(key, "expired")
+        for address, (_, _, expiry) in list(self.time_wait.items()):
+            if expiry <= now:
+                del self.time_wait[address]
+
+
+def connection_filename(pattern: str, address, isn: int) -> str:
+    '''fill the sender's host, port and ISN into pattern, or add them before the extension'''
+    if "{" not in pattern:
+        stem, ext = os.path.splitext(pattern)
+        pattern = stem + "-{host}-{port}-{isn}" + ext
+    return pattern.format(host=address[0], port=address[1], isn=isn)
 
 
 if __name__ == '__main__':
@@ -194,11 +604,79 @@ if __name__ == '__main__':
         format='%(asctime)s,%(msecs)03d %(levelname)-8s %(message)s',
         datefmt='%Y-%m-%d:%H:%M:%S')
 
-    if len(sys.argv) != 6:
-        print(
-            "\n===== Error usage, python3 receiver.py receiver_port sender_port FileReceived.txt flp rlp ======\n")
-        exit(0)
-
-    receiver = Receiver(*sys.argv[1:])
-    receiver.run()
+    parser = argparse.ArgumentParser(description="python3 receiver.py receiver_port sender_port FileReceived.txt flp rlp")
+    parser.add_argument("receiver_port", type=int)
+    parser.add_argument("sender_port", type=int)
+    parser.add_argument("filename")
+    parser.add_argument("flp", type=float)
+    parser.add_argument("rlp", type=float)
+    parser.add_argument("--log-mode", choices=LOG_MODES, default="full", help="segment logging in Receiver_log.txt")
+    parser.add_argument("--log-sample", type=int, default=100, help="log one segment in this many in sampled mode")
+    parser.add_argument("--link-delay", type=float, default=0, help="milliseconds to hold each incoming segment")
+    parser.add_argument("--rcv-win", type=int, default=None,
+                        help="bytes ahead of the next expected one that are accepted out of order (32768 for 16-bit, 16 MiB for 32-bit sequence numbers)")
+    parser.add_argument("--preallocate", type=int, default=0, help="bytes to reserve for the output file up front")
+    parser.add_argument("--no-sack", dest="sack", action="store_false", help="refuse selective acknowledgements")
+    parser.add_argument("--max-mss", type=int, default=None, help="largest MSS granted to a sender, default the most the agreed header allows")
+    parser.add_argument("--max-header-version", type=int, choices=sorted(HEADER_FORMATS), default=2,
+                        help="newest header version granted to a sender")
+    parser.add_argument("--engine", choices=("thread", "asyncio"), default="thread",
+                        help="blocking receive loop, or an asyncio event loop")
+    parser.add_argument("--gro", action="store_true",
+                        help="receive with UDP_GRO on Linux, several datagrams per syscall (thread engine)")
+    parser.add_argument("--multi", action="store_true",
+                        help="serve many senders at once, filename gets -host-port-isn (or fills {host}, {port}, {isn})")
+    parser.add_argument("--idle-timeout", type=float, default=30.0, help="seconds before an idle connection is dropped (--multi)")
+    parser.add_argument("--half-open-timeout", type=float, default=5.0,
+                        help="seconds a connection may stay at the SYN without DATA or FIN (--multi)")
+    parser.add_argument("--connections", type=int, default=0,
+                        help="exit after this many connections have ended, 0 serves forever (--multi)")
+    parser.add_argument("--no-fec", dest="fec", action="store_false", help="refuse XOR parity segments")
+    parser.add_argument("--no-compress", dest="compress", action="store_false", help="refuse compressed transfers")
+    parser.add_argument("--no-session", dest="session", action="store_false",
+                        help="refuse multi-file sessions, otherwise filename becomes their directory")
+    parser.add_argument("--ack-every", type=int, default=1,
+                        help="acknowledge every Nth in-order segment, gaps and reordering are still acked at once")
+    parser.add_argument("--ack-delay", type=float, default=10,
+                        help="milliseconds a coalesced ACK may be held back (--ack-every)")
+    parser.add_argument("--stats", help="write a JSON summary of counters and time per state to this file")
+    parser.add_argument("--snapshots", help="append a JSON snapshot of the stats to this file every --snapshot-interval")
+    parser.add_argument("--snapshot-interval", type=float, default=1.0, help="seconds between snapshots")
+    parser.add_argument("--stats-timing", action="store_true",
+                        help="time segment processing, reported under timings in --stats")
+    args = parser.parse_args()
 
+    options = dict(log_mode=args.log_mode, log_sample=args.log_sample, rcv_win=args.rcv_win,
+                   preallocate=args.preallocate, sack=args.sack, max_mss=args.max_mss,
+                   max_version=args.max_header_version, ack_every=args.ack_every, ack_delay=args.ack_delay,
+                   fec=args.fec, compress=args.compress, session=args.session)
+    if args.multi:
+        if args.engine != "thread":
+            parser.error("--multi runs its own receive loop, use the thread engine")
+        if args.stats or args.snapshots or args.stats_timing:
+            parser.error("--stats, --snapshots and --stats-timing follow a single connection, not --multi")
+        server = ReceiverServer(args.receiver_port, args.filename, args.flp, args.rlp,
+                                idle_timeout=args.idle_timeout, half_open_timeout=args.half_open_timeout,
+                                connections=args.connections, link_delay=args.link_delay, gro=args.gro,
+                                **options)
+        server.run()
+        sys.exit()
+    if args.engine == "asyncio":
+        if args.gro:
+            parser.error("--gro needs the thread engine")
+        from ptp_async import AsyncReceiver as Receiver
+    receiver = Receiver(args.receiver_port, args.sender_port, args.filename, args.flp, args.rlp,
+                        link_delay=args.link_delay, gro=args.gro, **options)
+    if args.stats_timing:
+        receiver.stats.instrument(receiver, TIMED_METHODS)
+    if args.snapshots:
+        receiver.stats.start_snapshots(args.snapshots, args.snapshot_interval)
+    try:
+        if args.engine == "asyncio":
+            asyncio.run(receiver.serve())
+        else:
+            receiver.run()
+    finally:
+        if args.stats:
+            receiver.stats.write_summary(args.stats)
+        receiver.stats.stop_snapshots()
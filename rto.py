@@ -0,0 +1,50 @@
+
+class RtoEstimator:
+    ALPHA = 1 / 8  # gain for the smoothed RTT
+    BETA = 1 / 4  # gain for the RTT variance
+    K = 4
+
+    def __init__(self, initial: float, adaptive: bool = True, min_rto: float = 0.02, max_rto: float = 60.0) -> None:
+        '''
+        Retransmission timeout from measured round trip times (RFC 6298), all values in seconds
+        :param initial: the timeout used until the first sample, i.e. the command line rto
+        :param adaptive: False keeps the timeout fixed at initial, samples still update srtt/rttvar
+        :param min_rto: lower bound of the computed timeout
+        :param max_rto: upper bound of the computed and backed off timeout
+        '''
+        self.adaptive = adaptive
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial
+        self.samples = 0
+        self.backoffs = 0
+
+    def sample(self, rtt: float) -> None:
+        '''
+        Feed one RTT measurement, only from segments that were never retransmitted (Karn's rule)
+        '''
+        self.samples += 1
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        if not self.adaptive:
+            return
+        # a fresh sample also clears any backoff
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + self.K * self.rttvar))
+
+    def backoff(self) -> None:
+        '''double the timeout after it expired'''
+        if not self.adaptive:
+            return
+        self.backoffs += 1
+        self.rto = min(self.max_rto, self.rto * 2)
+
+    def snapshot(self) -> dict:
+        '''the current estimate in seconds, with the number of samples and backoffs so far'''
+        return {"srtt": self.srtt, "rttvar": self.rttvar, "rto": self.rto,
+                "samples": self.samples, "backoffs": self.backoffs}
@@ -1,174 +1,295 @@
 
 import datetime, time  # to calculate the time delta of packet transmission
+import mmap, os  # zero-copy payloads
 import logging, sys  # to write the log
 import socket  # Core lib, to send packet via UDP socket
-from threading import Thread  # (Optional)threading will make the timer easily implemented
+from threading import Thread, Condition  # (Optional)threading will make the timer easily implemented
 import random
+import argparse
+import asyncio
+from functools import partial
+from itertools import islice
+
+from ptp_timer import TimerService  # one scheduler thread for every retransmission deadline
+from ptp_log import SegmentLogger, LOG_MODES  # buffered writer for Sender_log.txt
+from rto import RtoEstimator  # smoothed RTT and adaptive retransmission timeout
+from ptp_options import (OPT_SACK, OPT_VERSION, OPT_MSS, OPT_FEC, OPT_COMPRESS, OPT_SESSION,
+                         encode_options, decode_options)
+from ptp_header import (HEADER_V1, HEADER_FORMATS, DEFAULT_MSS, MAX_UDP_PAYLOAD,
+                        TYPE_DATA, TYPE_SYN, TYPE_FIN, TYPE_RESET, TYPE_FEC)
+from ptp_fec import FecEncoder, FEC_XOR, MAX_GROUP, parity_overhead  # XOR parity per group of segments
+from ptp_compress import CompressionStage, CODECS, CODEC_NAMES, READ_SIZE  # zlib/bz2/lzma in its own thread
+from ptp_session import SessionSource, RESUME, rechunk  # many files per connection, resumable
+from congestion import CONGESTION_CONTROLS  # fixed window, Reno or CUBIC
+from ptp_offload import gso_supported, gso_runs, send_gso  # several segments per sendmsg
+from ptp_stats import TransferStats  # counters, RTT histogram and time in each state
 
 BUFFERSIZE = 1024
+DUP_THRESH = 3  # duplicate ACKs, or segments SACKed above a hole, before fast retransmit
+PACING_GAIN = 1.25  # pace slightly faster than cwnd/srtt so pacing alone never limits the window
+CONTROL_TIMER = "control"  # timer key for SYN and FIN, DATA timers are keyed by sequence number
+TIMED_METHODS = ("send_new_segments", "receive_ack", "on_segment_timeout", "on_control_timeout")
 
 
 class Sender:
-    def __init__(self, sender_port: int, receiver_port: int, filename: str, max_win: int, rto: int) -> None:
+    def __init__(self, sender_port: int, receiver_port: int, filename: str, max_win: int, rto: int, wait_mode: str = "event",
+                 log_mode: str = "full", log_sample: int = 100, transfer_mode: str = "binary",
+                 rto_mode: str = "fixed", rto_min: float = 20, rto_max: float = 60000, sack: bool = False,
+                 congestion: str = "fixed", pacing: bool = False, mss: int = DEFAULT_MSS,
+                 header_version: int = 1, log_file: str = "Sender_log.txt", batch: int = 1,
+                 gso: str = "auto", fec: int = 0, compress: str = None, session: bool = False,
+                 files=()) -> None:
         '''
         The Sender will be able to connect the Receiver via UDP
         :param sender_port: the UDP port number to be used by the sender to send PTP segments to the receiver
         :param receiver_port: the UDP port number on which receiver is expecting to receive PTP segments from the sender
         :param filename: the name of the text file that must be transferred from sender to receiver using your reliable transport protocol.
-        :param max_win: the maximum window size in bytes for the sender window.
+        :param max_win: the maximum window size in bytes for the sender window, at most 32768 unless v2 headers are agreed.
         :param rot: the value of the retransmission timer in milliseconds. This should be an unsigned integer.
+        :param wait_mode: "event" blocks on a condition variable until an ACK, timeout or close wakes it, "spin" keeps the old busy-wait loops.
+        :param log_mode: "full", "sampled" (one segment in log_sample) or "off" for Sender_log.txt.
+        :param transfer_mode: "binary" sends the file byte-exact from an mmap, "text" sends 1000-character chunks encoded as UTF-8.
+        :param rto_mode: "fixed" always waits rto, "adaptive" starts from rto and follows the measured RTT with exponential backoff.
+        :param rto_min: lower bound in milliseconds for the adaptive timeout.
+        :param rto_max: upper bound in milliseconds for the adaptive timeout.
+        :param sack: ask the receiver for selective acknowledgements in the SYN, used if it agrees.
+        :param congestion: the congestion control algorithm, one of CONGESTION_CONTROLS, max_win caps its window.
+        :param pacing: spread each window's segments over one smoothed RTT instead of sending them back to back.
+        :param mss: payload bytes per DATA segment to ask for, the receiver may lower it.
+        :param header_version: 1 for 16-bit sequence numbers, 2 to ask for 32-bit ones.
+        :param log_file: where the segment log is written.
+        :param batch: new segments sent together when the window has room for them, 1 sends each on its own.
+        :param gso: "auto" sends a batch with one UDP_SEGMENT sendmsg where the kernel supports it, "off" never does.
+        :param fec: follow every fec new segments with an XOR parity segment if the receiver agrees, 0 never does.
+        :param compress: a codec of ptp_compress.CODECS to compress the file with if the receiver agrees, None sends it as is.
+        :param session: send filename as a multi-file session the receiver can resume, implied by files or a directory.
+        :param files: more files or directories to send after filename in the same session.
         '''
+        if header_version not in HEADER_FORMATS:
+            raise ValueError(f"unknown header version {header_version}")
+        if not 0 < mss <= HEADER_FORMATS[header_version].max_mss:
+            raise ValueError(f"mss must be between 1 and {HEADER_FORMATS[header_version].max_mss} bytes")
+        if not 0 <= fec <= MAX_GROUP:
+            raise ValueError(f"fec must be between 0 and {MAX_GROUP} segments")
+        if compress is not None and compress not in CODECS:
+            raise ValueError(f"unknown codec {compress}, expected one of {sorted(CODECS)}")
+        if fec and HEADER_FORMATS[header_version].size + mss + parity_overhead(fec) > MAX_UDP_PAYLOAD:
+            raise ValueError(f"mss too large for FEC segments of {fec}, they carry {parity_overhead(fec)} more bytes")
         self.sender_port = int(sender_port)
         self.receiver_port = int(receiver_port)
         self.sender_address = ("127.0.0.1", self.sender_port)
         self.receiver_address = ("127.0.0.1", self.receiver_port)
         self.filename = filename
-        self.window_size = int(max_win)/1000
+        self.max_win = int(max_win)
+        self.congestion = congestion
+        self.cc = None  # created in ptp_send once the MSS is agreed
+        self.recovery_point = None  # next_seq when the current loss recovery started
+        self.timeout_recovery = False  # the recovery began with a timeout, cwnd slow starts through it
+        self.lost_segments = 0  # segments a timeout marked lost that have not been resent yet
+        self.sacked_segments = 0  # segments in the window the receiver holds beyond the cumulative ACK
+        self.pacing = pacing
+        self.next_send_at = 0.0
         self.rto = rto
+        self.rtt = RtoEstimator(int(rto)/1000, adaptive=rto_mode == "adaptive",
+                                min_rto=float(rto_min)/1000, max_rto=float(rto_max)/1000)
         self.window = []
         self.closing = False
         self.connection_secured = False
-        
+        self.wait_mode = wait_mode
+        self.log_mode = log_mode
+        self.log_sample = log_sample
+        self.log_file = log_file
+        self.transfer_mode = transfer_mode
+        self.sack = sack
+        self.sack_enabled = False  # set once the receiver echoes the option
+        self.requested_fec = int(fec)
+        self.fec_group = 0  # the group size the receiver agreed to
+        self.fec = None  # FecEncoder of the current transfer
+        self.requested_codec = compress
+        self.codec = None  # the codec the receiver agreed to
+        self.deflater = None  # CompressionStage of the current transfer
+        self.session = None
+        if session or files or os.path.isdir(filename):
+            self.session = SessionSource([filename, *files])
+        self.resume = None  # (file index, offset) the receiver asked the session to continue from
+        self.requested_mss = int(mss)
+        self.requested_version = int(header_version)
+        # the handshake always uses the v1 header, these follow what the receiver accepted
+        self.header = HEADER_V1
+        self.mss = DEFAULT_MSS
+        self.total_duplicate_acks = 0
+        self.ack_received = False
+        self.timed_out = False
+        self.timers = None  # created by run(), the asyncio engine uses loop timers instead
+
+        # every change to window/ack/timeout state is made under this condition and notified
+        self.cond = Condition()
 
         # init the UDP socket
         logging.debug(f"The sender is using the address {self.sender_address}")
         self.sender_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
         self.sender_socket.bind(self.sender_address)
-
-
-        #  (Optional) start the listening sub-thread first
         self._is_active = True  # for the multi-threading
-        listen_thread = Thread(target=self.listen)
-        listen_thread.daemon = True
-        listen_thread.start()
+
+        self.batch = max(1, int(batch))
+        self.gso = self.batch > 1 and gso == "auto" and gso_supported(self.sender_socket)
+        self.stats = TransferStats("sender", self.rtt)
+        self.counters = self.stats.counters
 
         pass
 
     def ptp_open(self):
         # SYN - initiate two way handshake
-        self.syn_try += 1
-        ISN_int = int.from_bytes(self.ISN, "big")
-        typeSYN = (2).to_bytes(2, byteorder='big', signed=False)
-        segment = typeSYN + self.ISN
-        self.ack_received = False
-        with open("Sender_log.txt", "a+") as logfile:
-            if self.syn_try == 1:
-                self.start_time = time.time()
-            logfile.write("snd".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "SYN".ljust(7) + str(ISN_int).ljust(7) + str(0).ljust(7) + "\n")
-        logging.debug(f"snd\t\t{round((time.time() - self.start_time), 2)}\t\tSYN\t\t{ISN_int}\t\t0")
-        
-        # send to receiver
-        self.sender_socket.sendto(segment, self.receiver_address)
+        self.send_syn()
 
         # start timer for syn segment
-        self.timed_out = False
-        timer_thread = Thread(target = self.timer)
-        timer_thread.start()
+        self.start_control_timer()
 
         # wait for ack 
-        while not self.timed_out and not self.ack_received:
-            pass
+        self.wait_until(lambda: self.timed_out or self.ack_received)
+        self.timers.cancel(CONTROL_TIMER)
         pass
 
-    def ptp_send(self):
+    def send_syn(self):
+        self.syn_try += 1
+        self.counters["syn_sent"] += 1
+        self.stats.enter("handshake")
+        segment = HEADER_V1.pack(TYPE_SYN, self.ISN) + encode_options(self.syn_options())
+        self.ack_received = False
+        if self.syn_try == 1:
+            self.start_time = time.time()
+        self.log.log("snd", time.time() - self.start_time, "SYN", self.ISN, 0)
 
-        f = open(self.filename, "r")
-        self.i = 0
-        self.window = []
+        # send to receiver
+        self.syn_sent_at = time.monotonic()
+        self.sender_socket.sendto(segment, self.receiver_address)
+
+    def ptp_send(self):
+        self.start_data()
 
         # continually read data through file
         while True:
-            data = f.read(1000)
-            if data:
-
-                # if window is "full", wait
-                while len(self.window) == int(self.window_size):
-                    pass
-
-                # if this is the first packet
-                if self.i == 0 and len(self.window) == 0 and len(data) == 1000:
-
-                    seq_num = int.from_bytes(self.last_ack_received, "big") + (len(self.window) * len(data))
-
-                    if seq_num > 65535:
-                        seq_num = (seq_num - (65535) - 1).to_bytes(2, "big")
-                    else:
-                        seq_num = seq_num.to_bytes(2, "big")
-
-                else:
-                    if self.i == 0 and len(self.window) == 0:
-                        seq_num = int.from_bytes(self.last_ack_received, "big")
-                    else:
-                        seq_num = int.from_bytes(seq_num, "big") + 1000
-                
-                    if seq_num > 65535:
-                        seq_num = (seq_num - (65535) - 1).to_bytes(2, "big")
-                    else:
-                        seq_num = seq_num.to_bytes(2, "big")
-                    
-                # set values for segment
-                seq_num_int = int.from_bytes(seq_num, "big")
-                typeDATA = (0).to_bytes(2, byteorder='big', signed=False)
-                segment = typeDATA + seq_num + data.encode('utf-8')
-                
-                # add sent segment to window
-                self.window.append({"data": data, "seq_num": seq_num_int})
-                
-                # send segment
-                self.sender_socket.sendto(segment, self.receiver_address)
-
-                # record in log
-                with open("Sender_log.txt", "a+") as logfile:
-                    logfile.write("snd".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "DATA".ljust(7) + str(seq_num_int).ljust(7) + str(len(data)).ljust(7) + "\n")
-                logging.debug(f"snd \t\t{round((time.time() - self.start_time), 2)}\t\tDATA \t\t{seq_num_int}\t\t{len(data)}")
-
-                # if window length is 1, transfer timer to first segment
-                if len(self.window) == 1:
-                    self.ack_received = False
-                    self.timed_out = False
-                    timer_thread = Thread(target = self.timer)
-                    timer_thread.start()
-                self.i += 1
-            else:
-                break
 
-            # do not exit send function until all acks are received
-            while not self.timed_out and self.ack_received:
+            # if window is "full", wait, the congestion window may be smaller than max_win
+            self.wait_until(self.window_open)
+            self.pace()
+            payloads = self.next_batch()
+            if not payloads:
                 break
-        # todo add codes heres
-        
-        if self.i == int(self.window_size - 1) and not self.ack_received:
-            send_last_unacked_segment(self)
-        
-        while len(self.window) >0:
-            pass
-        # if still as above, send reset for last segment
-        pass
+            self.send_new_segments(payloads)
+        self.flush_parity()
 
+        # do not exit send function until all acks are received
+        self.wait_until(lambda: len(self.window) == 0)
+
+    def start_data(self):
+        '''set up the window once the handshake has agreed on the header and MSS'''
+        self.window = []
+        self.lost_segments = 0
+        self.sacked_segments = 0
+        self.next_seq = self.last_ack_received
+        # beyond half the sequence space ACKs compare wrongly, v1 headers allow 32768 bytes
+        max_win = min(self.max_win, 1 << (self.header.seq.bits - 1))
+        if max_win < self.max_win:
+            logging.debug(f"window limited to {max_win} bytes by {self.header.seq.bits}-bit sequence numbers")
+        self.cc = CONGESTION_CONTROLS[self.congestion](self.mss, max_win)
+        # a session is frame headers and file slices, byte-exact whatever the transfer mode
+        if self.codec is not None:
+            if self.session is not None:
+                chunks = self.session.pieces(*self.resume)
+            else:
+                # compressed payloads are cut from one stream, the file is read in larger pieces for it
+                chunks = iter_payloads(self.filename, self.transfer_mode,
+                                       READ_SIZE if self.transfer_mode == "binary" else self.mss)
+            self.deflater = CompressionStage(chunks, self.codec, self.mss, self.counters)
+        elif self.session is not None:
+            self.payloads = rechunk(self.session.pieces(*self.resume), self.mss)
+        else:
+            self.payloads = iter_payloads(self.filename, self.transfer_mode, self.mss)
+        self.fec = FecEncoder(self.fec_group) if self.fec_group else None
+        self.stats.enter("established")
+
+    def in_flight(self):
+        '''segments still in the network: sent and not acked, neither SACKed nor marked lost by a timeout'''
+        return len(self.window) - self.lost_segments - self.sacked_segments
+
+    def window_open(self):
+        return self.in_flight() < max(1, self.cc.window() // self.mss)
+
+    def next_batch(self, block=True):
+        '''
+        the next payloads to send together, as many as the window has room for up to self.batch
+        :param block: wait for the compression stage, with False None is returned while it has nothing ready
+        '''
+        room = max(1, self.cc.window() // self.mss) - self.in_flight()
+        count = 1 if self.pacing else max(1, min(room, self.batch))
+        if self.deflater is not None:
+            return self.deflater.take(count, block)
+        return list(islice(self.payloads, count))
+
+    def send_new_segments(self, payloads):
+        # the header is packed once, retransmits send the same header and payload again
+        segments = []
+        sent_at = time.monotonic()
+        for payload in payloads:
+            self.counters["bytes_sent"] += len(payload)
+            seq_num_int = self.next_seq
+            self.next_seq = self.header.seq.add(self.next_seq, len(payload))
+            segments.append({"seq_num": seq_num_int, "header": self.header.pack(TYPE_DATA, seq_num_int),
+                             "payload": payload, "sent_at": sent_at, "retransmitted": False, "sacked": False,
+                             "sack_retransmitted": None, "lost": False})
+
+        # add sent segments to window
+        with self.cond:
+            first_in_flight = len(self.window) == 0
+            self.window.extend(segments)
+
+        # send segments
+        send_segments(self, segments)
+
+        # record in log
+        for segment in segments:
+            self.log.log("snd", time.time() - self.start_time, "DATA", segment['seq_num'], len(segment['payload']))
+
+        # parity goes after its group, it is never retransmitted and holds no window space
+        if self.fec is not None:
+            for segment in segments:
+                send_parity(self, self.fec.add(segment['seq_num'], segment['payload']))
+
+        # the oldest unacked segment carries the retransmission deadline
+        if first_in_flight:
+            self.start_segment_timer(segments[0]['seq_num'])
+
+
+    def flush_parity(self):
+        '''parity for the last, partly filled group once the file is read'''
+        if self.fec is not None:
+            send_parity(self, self.fec.flush())
 
     def ptp_close(self):
         # closing, similar to SYNACK
+        self.send_fin()
+        self.start_control_timer()
+        self.wait_until(lambda: self.timed_out or self.ack_received)
+        self.timers.cancel(CONTROL_TIMER)
+        pass
+
+    def send_fin(self):
         self.fin_try += 1
         self.closing = True
-        typeFIN = (3).to_bytes(2, byteorder='big', signed=False)
-        seq_num_int = int.from_bytes(self.last_ack_received, "big") + 1
-        if seq_num_int > 65535:
-            seq_num = (seq_num_int - 65535 - 1).to_bytes(2, "big")
-        else:
-            seq_num = (seq_num_int).to_bytes(2, "big")
-
-        segment = typeFIN + seq_num
+        self.counters["fin_sent"] += 1
+        self.stats.enter("closing")
+        seq_num_int = self.header.seq.add(self.last_ack_received, 1)
+        segment = self.header.pack(TYPE_FIN, seq_num_int)
         self.ack_received = False
-        with open("Sender_log.txt", "a+") as logfile:
-            logfile.write("snd".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "FIN".ljust(7) + str(seq_num_int).ljust(7) + str(0).ljust(7) + "\n")
-        logging.debug(f"snd\t\t{round((time.time() - self.start_time), 2)}\t\tFIN\t\t{seq_num_int}\t\t0")
+        self.log.log("snd", time.time() - self.start_time, "FIN", seq_num_int, 0)
         self.sender_socket.sendto(segment, self.receiver_address)
-        self.timed_out = False
-        timer_thread = Thread(target = self.timer)
-        timer_thread.start()
-        while not self.timed_out and not self.ack_received:
-            pass
-        pass
+
+    def send_reset(self):
+        # the receiver may not know the negotiated header yet, only the type is read from a RESET
+        reply_message = self.header.pack(TYPE_RESET, 0)
+        self.log.log("snd", time.time() - self.start_time, "RESET", 0, 0)
+        self.sender_socket.sendto(reply_message, self.receiver_address)
 
 
     def listen(self):
@@ -178,84 +299,182 @@ class Sender:
             # todo add socket
             # store incoming message
             incoming_message, _ = self.sender_socket.recvfrom(BUFFERSIZE)
-            acknum = int.from_bytes(incoming_message[2:4], "big")
-
-            # write to log
-            with open("Sender_log.txt", "a+") as logfile:
-                logfile.write("rcv".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "ACK".ljust(7) + str(acknum).ljust(7) + str(0).ljust(7) + "\n")
-            logging.debug(f"rcv\t\t{round((time.time() - self.start_time), 2)}\t\tACK\t\t{acknum}\t\t0")
-            self.ack_received = True
-    
-            
-            # this is the ack for a synack
-            if self.last_ack_received == '':
-                self.connection_secured = True
-                self.last_ack_was_syn = True
-                self.last_ack_received = incoming_message[2:4]
-            elif self.closing:
-                self.connection_secured = False
-                self._is_active = False
+            with self.cond:
+                self.receive_ack(incoming_message)
+                self.cond.notify_all()
+
+    def receive_ack(self, incoming_message):
+        '''parse and log one ACK datagram, then hand it to handle_ack'''
+        # the ACK of the SYN is v1, everything after it uses the negotiated header
+        header = HEADER_V1 if self.last_ack_received is None else self.header
+        if len(incoming_message) < header.size:
+            return
+        _, acknum = header.unpack(incoming_message)
+        self.counters["acks_received"] += 1
+
+        # write to log
+        self.log.log("rcv", time.time() - self.start_time, "ACK", acknum, 0)
+        self.handle_ack(acknum, incoming_message[header.size:])
+
+    def handle_ack(self, acknum, extra):
+        '''
+        update window and timer state for one ACK, called with self.cond held
+        :param extra: what follows the header, SYN options or SACK blocks
+        '''
+        self.ack_received = True
+        # this is the ack for a synack
+        if self.last_ack_received is None:
+            if self.syn_try == 1:
+                self.take_rtt_sample(self.syn_sent_at)
+            accepted = decode_options(extra)
+            self.sack_enabled = OPT_SACK in accepted
+            if OPT_FEC in accepted and len(accepted[OPT_FEC]) == 2:
+                self.fec_group = accepted[OPT_FEC][1]
+            if OPT_COMPRESS in accepted and accepted[OPT_COMPRESS]:
+                self.codec = CODEC_NAMES.get(accepted[OPT_COMPRESS][0])
+            if self.session is not None and len(accepted.get(OPT_SESSION, b'')) == RESUME.size:
+                session_id, index, offset = RESUME.unpack(accepted[OPT_SESSION])
+                if session_id == self.session.id:
+                    self.resume = (index, offset)
+            if OPT_VERSION in accepted:
+                self.header = HEADER_FORMATS.get(accepted[OPT_VERSION][0], HEADER_V1)
+            if OPT_MSS in accepted:
+                self.mss = int.from_bytes(accepted[OPT_MSS], "big")
+            self.connection_secured = True
+            self.last_ack_was_syn = True
+            self.last_ack_received = acknum
+        elif self.closing:
+            self.connection_secured = False
+            self._is_active = False
+        else:
+            # Duplicate ack
+            if self.last_ack_received == acknum and not self.last_ack_was_syn:
+                # repeated ack send last 
+                self.duplicate_acks += 1
+                self.total_duplicate_acks += 1
+                self.counters["duplicate_acks"] += 1
+                if self.duplicate_acks == DUP_THRESH and not self.sack_enabled:
+                    self.enter_recovery()
+                    self.counters["fast_retransmits"] += 1
+                    send_last_unacked_segment(self)
+                    self.duplicate_acks = 0
             else:
-                # Duplicate ack
-                if self.last_ack_received == incoming_message[2:4] and not self.last_ack_was_syn:
-                    # repeated ack send last 
-                    self.duplicate_acks += 1
-                    if self.duplicate_acks == 3:
-                        send_last_unacked_segment(self)
-                        self.duplicate_acks = 0
-                else:
-                    # normal ack
-                    self.duplicate_acks = 1
-                    self.last_ack_was_syn = False
-                    val = int.from_bytes(self.last_ack_received, "big")
-                    if int.from_bytes(incoming_message[2:4], "big") - val > 1000:
-                        val += 1000
-                    if len(self.window) > 0:
-                        if len(self.window) == 1:
-                            del self.window[0]
-                        else:
-                            for i, data in enumerate(self.window):
-                                if self.window[i]['seq_num'] == val:
-                                    break
-                                del self.window[i]
-                                i = i -1
-                            del self.window[i]
-                    self.last_ack_received = incoming_message[2:4]
-                    if len(self.window) > 0:
-                        self.ack_received = False
-                        self.i = self.i - 1
-                        self.timed_out = False
-                        timer_thread = Thread(target = self.timer)
-                        timer_thread.start()
-
+                # normal ack, slide the window past every segment it covers
+                self.duplicate_acks = 1
+                self.last_ack_was_syn = False
+                acked = None
+                acked_bytes = 0
+                while len(self.window) > 0 and self.header.seq.lt(self.window[0]['seq_num'], acknum):
+                    acked = self.window.pop(0)
+                    acked_bytes += len(acked['payload'])
+                    if acked['lost']:
+                        self.lost_segments -= 1
+                    if acked['sacked']:
+                        self.sacked_segments -= 1
+                    self.timers.cancel(acked['seq_num'])
+                # Karn's rule, a retransmitted segment's ACK is ambiguous so it gives no sample
+                if acked is not None and not acked['retransmitted']:
+                    self.take_rtt_sample(acked['sent_at'])
+                if self.recovery_point is not None and not self.header.seq.lt(acknum, self.recovery_point):
+                    self.recovery_point = None
+                    self.timeout_recovery = False
+                    self.stats.enter("established")
+                if acked_bytes and (self.recovery_point is None or self.timeout_recovery):
+                    self.cc.on_ack(acked_bytes, self.rtt.srtt)
+                self.last_ack_received = acknum
+                self.resend_lost()
+                # restart the deadline for whichever segment is now the oldest
+                if len(self.window) > 0:
+                    self.start_segment_timer(self.window[0]['seq_num'])
+            if self.sack_enabled and extra:
+                self.handle_sack(extra)
+
+    def handle_sack(self, blocks):
+        '''mark the segments inside the SACK blocks and retransmit the holes between them'''
+        seq = self.header.seq
+        for start, end in self.header.unpack_blocks(blocks):
+            for segment in self.window:
+                if not segment['sacked'] and not seq.lt(segment['seq_num'], start) and seq.lt(segment['seq_num'], end):
+                    segment['sacked'] = True
+                    self.sacked_segments += 1
+                    if segment['lost']:
+                        segment['lost'] = False
+                        self.lost_segments -= 1
+
+        # a hole with DUP_THRESH segments sacked above it is lost; if DUP_THRESH more
+        # duplicate ACKs arrive after it was resent, the retransmission was lost too
+        sacked_above = 0
+        for segment in reversed(self.window):
+            if segment['sacked']:
+                sacked_above += 1
+            elif sacked_above >= DUP_THRESH:
+                resent_at = segment['sack_retransmitted']
+                if resent_at is None or self.total_duplicate_acks - resent_at >= DUP_THRESH:
+                    self.enter_recovery()
+                    segment['sack_retransmitted'] = self.total_duplicate_acks
+                    self.counters["sack_retransmits"] += 1
+                    retransmit_segment(self, segment)
+
+
+    def resend_lost(self):
+        '''resend the segments a timeout marked lost, oldest first, as far as the window allows'''
+        for segment in self.window:
+            if not self.lost_segments or not self.window_open():
+                break
+            if segment['lost']:
+                retransmit_segment(self, segment)
+
+    def enter_recovery(self):
+        '''tell congestion control about a loss, once for every window of data in flight'''
+        if self.recovery_point is None:
+            self.cc.on_loss()
+            self.recovery_point = self.next_seq
+            self.stats.enter("recovery")
+
+    def pace(self):
+        '''with pacing on, sleep until this segment's slot so a window spans one smoothed RTT'''
+        delay = self.pacing_delay()
+        if delay > 0:
+            time.sleep(delay)
+            self.pacing_delay()
+
+    def pacing_delay(self):
+        '''seconds until the next segment's slot, once it is 0 the slot after it is booked'''
+        if not self.pacing or self.rtt.srtt is None:
+            return 0
+        now = time.monotonic()
+        if self.next_send_at > now:
+            return self.next_send_at - now
+        self.next_send_at = now + self.rtt.srtt * self.mss / (PACING_GAIN * self.cc.window())
+        return 0
 
     def run(self):
         '''
         This function contain the main logic of the receiver
         '''
         # todo add/modify codes here
-        open('Sender_log.txt', 'w').close()
+        self.log = SegmentLogger(self.log_file, self.log_mode, self.log_sample)
+        self.timers = TimerService()
+
+        #  (Optional) start the listening sub-thread first
+        listen_thread = Thread(target=self.listen)
+        listen_thread.daemon = True
+        listen_thread.start()
 
 
-        self.syn_try = 0
-        self.fin_try = 0
-        ISN_int = random.randint(0, 65535)
-        self.ISN = ISN_int.to_bytes(2, byteorder = "big", signed=False)
-        self.last_ack_received = ''
+        self.reset_state()
         while self.syn_try < 4 and not self.connection_secured:
             logging.debug("Attempting to connect")
             logging.debug(f"trying to connect attempt: {self.syn_try}")
             self.ptp_open()
+        if self.session_refused():
+            self.connection_secured = False
         if not self.connection_secured:
             logging.debug("Connection failed, not sending file")
-            typeRESET = (4).to_bytes(2, byteorder='big', signed=False)
-            reply_message = typeRESET + b'0'
-            with open("Sender_log.txt", "a+") as logfile:
-                logfile.write(f"snd".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "RESET".ljust(7) + str(0).ljust(7) + str(0).ljust(7) + "\n")
-            logging.debug(f"snd\t\t{round((time.time() - self.start_time), 2)}\t\RESET\t\t0\t\t0")
-            self.sender_socket.sendto(reply_message, self.receiver_address)
+            self.send_reset()
             self._is_active = False
             self.ack_received = True
+            self.log.close()
             exit()
         else:
             logging.debug("Connection success, now sending file")
@@ -265,44 +484,199 @@ class Sender:
                 logging.debug(f"Attempting to close attempt: {self.fin_try}")
                 self.ptp_close()
             if self.connection_secured:
-                typeRESET = (4).to_bytes(2, byteorder='big', signed=False)
-                reply_message = typeRESET + b'0'
-                with open("Sender_log.txt", "a+") as logfile:
-                    logfile.write(f"snd".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "RESET".ljust(7) + str(0).ljust(7) + str(0).ljust(7) + "\n")
-                logging.debug(f"snd\t\t{round((time.time() - self.start_time), 2)}\t\RESET\t\t0\t\t0")
-                self.sender_socket.sendto(reply_message, self.receiver_address)
+                self.send_reset()
             logging.debug("Connection Closed")
+            self.stats.enter("closed")
+            self.report_counters()
             self._is_active = False
+            self.log.close()
 
             sys.exit()
 
-    def timer(self):
-        ''' Multithread to time each STP ack'''
-        time_started = time.time()
-        while not self.ack_received:
-            if time.time() >= time_started + (int(self.rto)/1000):
-                self.timed_out = True
-                if self.connection_secured and not self.closing:
-                    send_last_unacked_segment(self)
+    def session_refused(self):
+        '''a session the receiver did not agree to cannot be sent as a plain file'''
+        if self.connection_secured and self.session is not None and self.resume is None:
+            logging.debug("The receiver refused the session")
+            return True
+        return False
+
+    def report_counters(self):
+        logging.debug(f"sent {self.counters['segments_sent']} segments in {self.counters['send_calls']} send calls, "
+                      f"{self.counters['retransmissions']} retransmissions")
+        if self.deflater is not None:
+            self.deflater.close()
+            logging.debug(f"{self.codec} compressed {self.counters['raw_bytes']} bytes to {self.counters['bytes_sent']}")
+
+    def reset_state(self):
+        self.syn_try = 0
+        self.fin_try = 0
+        self.ISN = random.randint(0, 65535)
+        self.last_ack_received = None
+
+    def syn_options(self):
+        '''the options asked for in the SYN'''
+        options = {}
+        if self.sack:
+            options[OPT_SACK] = b''
+        if self.requested_version != 1:
+            options[OPT_VERSION] = bytes([self.requested_version])
+        if self.requested_mss != DEFAULT_MSS:
+            options[OPT_MSS] = self.requested_mss.to_bytes(2, "big")
+        if self.requested_fec:
+            options[OPT_FEC] = bytes((FEC_XOR, self.requested_fec))
+        if self.requested_codec is not None:
+            options[OPT_COMPRESS] = bytes((CODECS[self.requested_codec],))
+        if self.session is not None:
+            options[OPT_SESSION] = self.session.id
+        return options
+
+    def take_rtt_sample(self, sent_at):
+        sample = time.monotonic() - sent_at
+        self.rtt.sample(sample)
+        self.stats.rtt(sample)
+        if self.rtt.adaptive:
+            logging.debug("rtt sample: srtt %.1f ms rttvar %.1f ms rto %.1f ms",
+                          self.rtt.srtt * 1000, self.rtt.rttvar * 1000, self.rtt.rto * 1000)
+
+    def start_control_timer(self):
+        '''arm the SYN/FIN timer, ptp_open and ptp_close wake up when it fires'''
+        with self.cond:
+            self.timed_out = False
+        self.timers.schedule(CONTROL_TIMER, self.rtt.rto, self.on_control_timeout)
+
+    def start_segment_timer(self, seq_num_int):
+        '''(re-)arm the retransmission deadline of one DATA segment'''
+        self.timers.schedule(seq_num_int, self.rtt.rto, partial(self.on_segment_timeout, seq_num_int))
+
+    def on_control_timeout(self):
+        with self.cond:
+            self.rtt.backoff()
+            self.timed_out = True
+            self.cond.notify_all()
+
+    def on_segment_timeout(self, seq_num_int):
+        '''runs on the timer thread when a DATA segment has not been acked in time'''
+        if not self.connection_secured or self.closing:
+            return
+        with self.cond:
+            # only the oldest segment's deadline is the retransmission timeout, the ones resent
+            # behind it would otherwise expire together and back off and shrink cwnd once each
+            if not self.window or self.window[0]['seq_num'] != seq_num_int:
                 return
+            self.rtt.backoff()
+            self.cc.on_timeout()
+            self.recovery_point = self.next_seq
+            self.timeout_recovery = True
+            self.stats.enter("recovery")
+            self.counters["timeouts"] += 1
+            # everything outstanding is presumed lost and resent in slow start as ACKs
+            # open the window, otherwise it would hold the window shut until it times out too
+            for outstanding in self.window:
+                if not outstanding['sacked'] and not outstanding['lost']:
+                    outstanding['lost'] = True
+                    self.lost_segments += 1
+            retransmit_segment(self, self.window[0])
+
+    def wait_until(self, predicate, timeout=None):
+        '''block the calling thread until predicate() is true, either by spinning or on self.cond'''
+        if self.wait_mode == "spin":
+            deadline = None if timeout is None else time.time() + timeout
+            while not predicate():
+                if deadline is not None and time.time() >= deadline:
+                    return False
+            return True
+        with self.cond:
+            return self.cond.wait_for(predicate, timeout)
     
     
 def send_last_unacked_segment(self):
     if len(self.window) > 0:
-        data = self.window[0]['data']
-        seq_num = self.last_ack_received
-        seq_num_int = int.from_bytes(seq_num, "big")
-        typeDATA = (0).to_bytes(2, byteorder='big', signed=False)
-        segment = typeDATA + seq_num + data.encode('utf-8')
-        self.sender_socket.sendto(segment, self.receiver_address)
-        with open("Sender_log.txt", "a+") as logfile:
-            logfile.write("snd".ljust(7) + str(round((time.time() - self.start_time), 2)).ljust(7) + "DATA".ljust(7) + str(seq_num_int).ljust(7) + str(len(data)).ljust(7) +  "\n")
-        logging.debug(f"snd\t\t{(round((time.time() - self.start_time), 2))}\t\tDATA\t\t{seq_num_int}\t\t{len(data)}")
-        self.timed_out = False
-        timer_thread = Thread(target = self.timer)
-        timer_thread.daemon = True
-        timer_thread.start()
-        
+        retransmit_segment(self, self.window[0])
+
+
+def send_segment(self, segment):
+    '''scatter-gather send of the segment's header and payload, neither is copied in Python'''
+    self.counters["send_calls"] += 1
+    self.counters["segments_sent"] += 1
+    try:
+        self.sender_socket.sendmsg([segment['header'], segment['payload']], (), 0, self.receiver_address)
+    except BlockingIOError:
+        # only the asyncio engine's socket is nonblocking, a full buffer is just another loss
+        pass
+
+
+def send_segments(self, segments):
+    '''send new segments, a whole batch per sendmsg when UDP GSO is enabled'''
+    if self.gso and len(segments) > 1:
+        gso_size = self.header.size + self.mss
+        try:
+            for run in gso_runs([(segment['header'], segment['payload']) for segment in segments], gso_size):
+                self.counters["send_calls"] += 1
+                send_gso(self.sender_socket, run, gso_size, self.receiver_address)
+            self.counters["segments_sent"] += len(segments)
+            return
+        except BlockingIOError:
+            # the rest of the batch counts as lost, as in send_segment
+            self.counters["segments_sent"] += len(segments)
+            return
+        except OSError as e:
+            # e.g. a device that cannot segment; anything already sent just arrives twice
+            logging.debug(f"UDP GSO send failed ({e}), sending one segment per call")
+            self.gso = False
+    for segment in segments:
+        send_segment(self, segment)
+
+
+def send_parity(self, parity):
+    '''send one (first seq, payload) from the FecEncoder, None sends nothing'''
+    if parity is None:
+        return
+    seq_num_int, payload = parity
+    self.counters["fec_sent"] += 1
+    send_segment(self, {"header": self.header.pack(TYPE_FEC, seq_num_int), "payload": payload})
+    self.log.log("snd", time.time() - self.start_time, "FEC", seq_num_int, len(payload))
+
+
+def retransmit_segment(self, segment):
+    seq_num_int = segment['seq_num']
+    segment['retransmitted'] = True
+    if segment['lost']:
+        segment['lost'] = False
+        self.lost_segments -= 1
+    self.counters["retransmissions"] += 1
+    send_segment(self, segment)
+    self.log.log("snd", time.time() - self.start_time, "DATA", seq_num_int, len(segment['payload']))
+    # re-arming replaces the pending deadline, so a segment never has two timers
+    self.start_segment_timer(seq_num_int)
+
+def iter_payloads(filename, transfer_mode="binary", size=DEFAULT_MSS):
+    '''
+    Yield the payloads of the file in order
+    :param transfer_mode: "binary" slices size-byte memoryviews out of an mmap of the file,
+                          "text" reads size characters at a time and sends their UTF-8 encoding in
+                          payloads of at most size bytes
+    '''
+    if transfer_mode == "text":
+        with open(filename, "r") as f:
+            while True:
+                data = f.read(size)
+                if not data:
+                    return
+                # multibyte characters can push a chunk past the MSS, split it rather than overflow
+                data = data.encode('utf-8')
+                for offset in range(0, len(data), size):
+                    yield data[offset:offset + size]
+
+    with open(filename, "rb") as f:
+        length = os.fstat(f.fileno()).st_size
+        if length == 0:
+            return
+        # the views keep the mapping alive after the file is closed
+        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    for offset in range(0, length, size):
+        yield view[offset:offset + size]
+
+
 if __name__ == '__main__':
     # logging is useful for the log part: https://docs.python.org/3/library/logging.html
     logging.basicConfig(
@@ -312,11 +686,68 @@ if __name__ == '__main__':
         format='%(asctime)s,%(msecs)03d %(levelname)-8s %(message)s',
         datefmt='%Y-%m-%d:%H:%M:%S')
 
-    if len(sys.argv) != 6:
-        print(
-            "\n===== Error usage, python3 sender.py sender_port receiver_port FileReceived.txt max_win rot ======\n")
-        exit(0)
-
-    sender = Sender(*sys.argv[1:])
-    sender.run()
-
+    parser = argparse.ArgumentParser(description="python3 sender.py sender_port receiver_port FileReceived.txt max_win rot")
+    parser.add_argument("sender_port", type=int)
+    parser.add_argument("receiver_port", type=int)
+    parser.add_argument("filename")
+    parser.add_argument("max_win", type=int)
+    parser.add_argument("rto", type=int)
+    parser.add_argument("--wait-mode", choices=("event", "spin"), default="event",
+                        help="block on a condition variable (event) or busy-wait on shared flags (spin)")
+    parser.add_argument("--log-mode", choices=LOG_MODES, default="full", help="segment logging in Sender_log.txt")
+    parser.add_argument("--log-sample", type=int, default=100, help="log one segment in this many in sampled mode")
+    parser.add_argument("--transfer-mode", choices=("binary", "text"), default="binary",
+                        help="send the file byte-exact (binary) or as 1000-character UTF-8 chunks (text)")
+    parser.add_argument("--rto-mode", choices=("fixed", "adaptive"), default="fixed",
+                        help="keep rto fixed, or use it as the initial value of a timeout following the measured RTT")
+    parser.add_argument("--rto-min", type=float, default=20, help="lower bound of the adaptive timeout in ms")
+    parser.add_argument("--rto-max", type=float, default=60000, help="upper bound of the adaptive timeout in ms")
+    parser.add_argument("--sack", action="store_true", help="negotiate selective acknowledgements")
+    parser.add_argument("--cc", choices=sorted(CONGESTION_CONTROLS), default="fixed",
+                        help="congestion control, max_win stays the upper bound of the window")
+    parser.add_argument("--pacing", action="store_true", help="spread segments evenly over the smoothed RTT")
+    parser.add_argument("--mss", type=int, default=DEFAULT_MSS, help="payload bytes per segment to negotiate, up to 32768 with v1 headers and the UDP maximum with v2")
+    parser.add_argument("--header-version", type=int, choices=sorted(HEADER_FORMATS), default=1,
+                        help="1 for 16-bit sequence numbers, 2 to negotiate 32-bit ones")
+    parser.add_argument("--engine", choices=("thread", "asyncio"), default="thread",
+                        help="listen thread and blocking waits, or an asyncio event loop")
+    parser.add_argument("--batch", type=int, default=1, help="new segments sent together when the window allows")
+    parser.add_argument("--gso", choices=("auto", "off"), default="auto",
+                        help="send each batch with one UDP_SEGMENT sendmsg where Linux supports it")
+    parser.add_argument("--fec", type=int, default=0,
+                        help="send an XOR parity segment after every N new segments if the receiver agrees, 0 is off")
+    parser.add_argument("--compress", choices=sorted(CODECS), default=None,
+                        help="compress the file as one stream if the receiver agrees")
+    parser.add_argument("--session", action="store_true",
+                        help="send as a resumable multi-file session, implied when filename is a directory")
+    parser.add_argument("--files", nargs="+", default=(), metavar="PATH",
+                        help="more files or directories to send after filename in the same session")
+    parser.add_argument("--stats", help="write a JSON summary of counters, RTTs and time per state to this file")
+    parser.add_argument("--snapshots", help="append a JSON snapshot of the stats to this file every --snapshot-interval")
+    parser.add_argument("--snapshot-interval", type=float, default=1.0, help="seconds between snapshots")
+    parser.add_argument("--stats-timing", action="store_true",
+                        help="time the send, ACK and timer callbacks, reported under timings in --stats")
+    args = parser.parse_args()
+
+    if args.engine == "asyncio":
+        from ptp_async import AsyncSender as Sender
+    sender = Sender(args.sender_port, args.receiver_port, args.filename, args.max_win, args.rto,
+                    wait_mode=args.wait_mode, log_mode=args.log_mode, log_sample=args.log_sample,
+                    transfer_mode=args.transfer_mode, rto_mode=args.rto_mode, rto_min=args.rto_min,
+                    rto_max=args.rto_max, sack=args.sack,
+                    congestion=args.cc, pacing=args.pacing, mss=args.mss,
+                    header_version=args.header_version, batch=args.batch, gso=args.gso,
+                    fec=args.fec, compress=args.compress, session=args.session, files=args.files)
+    if args.stats_timing:
+        sender.stats.instrument(sender, TIMED_METHODS)
+    if args.snapshots:
+        sender.stats.start_snapshots(args.snapshots, args.snapshot_interval)
+    try:
+        if args.engine == "asyncio":
+            asyncio.run(sender.transfer())
+            sys.exit()
+        sender.run()
+    finally:
+        if args.stats:
+            sender.stats.write_summary(args.stats)
+        sender.stats.stop_snapshots()
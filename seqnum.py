@@ -0,0 +1,35 @@
+
+'''Sequence number arithmetic shared by the sender and the receiver, all modulo 2**bits'''
+
+SEQ_BITS = 16
+
+
+def seq_add(seq: int, n: int, bits: int = SEQ_BITS) -> int:
+    '''seq + n, wrapped around to 0 after 2**bits - 1'''
+    return (seq + n) & ((1 << bits) - 1)
+
+
+def seq_diff(a: int, b: int, bits: int = SEQ_BITS) -> int:
+    '''signed distance from b to a, i.e. how far a is ahead of b (negative if behind)'''
+    half = 1 << (bits - 1)
+    return ((a - b + half) & ((1 << bits) - 1)) - half
+
+
+def seq_lt(a: int, b: int, bits: int = SEQ_BITS) -> bool:
+    '''True if a comes before b'''
+    return seq_diff(a, b, bits) < 0
+
+
+class SeqSpace:
+    def __init__(self, bits: int = SEQ_BITS) -> None:
+        '''the helpers above bound to one sequence space, e.g. SeqSpace(32) for the v2 header'''
+        self.bits = bits
+
+    def add(self, seq: int, n: int) -> int:
+        return seq_add(seq, n, self.bits)
+
+    def diff(self, a: int, b: int) -> int:
+        return seq_diff(a, b, self.bits)
+
+    def lt(self, a: int, b: int) -> bool:
+        return seq_lt(a, b, self.bits)
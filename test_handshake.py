@@ -0,0 +1,59 @@
+
+'''The receiver's side of the SYN exchange, driven with hand-made segments over loopback'''
+
+import socket
+
+from ptp_header import HEADER_V1, HEADER_V2, TYPE_SYN, TYPE_DATA
+from ptp_options import OPT_VERSION, OPT_MSS, encode_options, decode_options
+from reciever import Receiver
+
+
+def make_receiver(tmp_path):
+    sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    peer = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    peer.bind(("127.0.0.1", 0))
+    peer.settimeout(2)
+    receiver = Receiver(0, peer.getsockname()[1], str(tmp_path / "out.txt"), 0, 0,
+                        log_mode="off", log_file=str(tmp_path / "log.txt"), sock=sock)
+    receiver.start()
+    return receiver, peer
+
+
+def deliver(receiver, peer, message):
+    receiver.incoming_message, receiver.sender_address = message, peer.getsockname()
+    return receiver.process_segment()
+
+
+def test_v2_data_after_isn_65535(tmp_path):
+    receiver, peer = make_receiver(tmp_path)
+    try:
+        deliver(receiver, peer, HEADER_V1.pack(TYPE_SYN, 65535) + encode_options({OPT_VERSION: bytes([2])}))
+        reply = peer.recv(100)
+        _, first_seq = HEADER_V1.unpack(reply)
+        assert first_seq == 0  # the SYN's ACK wraps in the 16-bit space
+        assert decode_options(reply[HEADER_V1.size:])[OPT_VERSION] == bytes([2])
+
+        # the sender starts at the ACKed number, now in the 32-bit space
+        deliver(receiver, peer, HEADER_V2.pack(TYPE_DATA, first_seq) + b"x" * 100)
+        _, acked = HEADER_V2.unpack(peer.recv(100))
+        assert acked == 100
+        assert receiver.reassembly.delivered == 100
+        assert receiver.counters["duplicates"] == 0
+    finally:
+        receiver.finish()
+        peer.close()
+
+
+def test_v1_mss_is_clamped(tmp_path):
+    receiver, peer = make_receiver(tmp_path)
+    try:
+        deliver(receiver, peer, HEADER_V1.pack(TYPE_SYN, 100) + encode_options({OPT_MSS: (40000).to_bytes(2, "big")}))
+        granted = decode_options(peer.recv(100)[HEADER_V1.size:])
+        assert OPT_VERSION not in granted
+        # one segment may not move the 16-bit sequence number by more than half its space
+        assert int.from_bytes(granted[OPT_MSS], "big") == 32768
+        assert receiver.mss == 32768
+    finally:
+        receiver.finish()
+        peer.close()
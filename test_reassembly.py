@@ -0,0 +1,70 @@
+
+'''Sequence number wraparound at 65535 and the receiver's reassembly across it'''
+
+from reassembly import ReassemblyBuffer
+from seqnum import seq_add, seq_diff, seq_lt
+
+
+def test_seq_arithmetic_across_wrap():
+    assert seq_add(65535, 1) == 0
+    assert seq_add(65000, 1000) == 464
+    assert seq_diff(0, 65535) == 1
+    assert seq_diff(65535, 0) == -1
+    assert seq_diff(464, 65000) == 1000
+    assert seq_lt(65535, 0)
+    assert not seq_lt(0, 65535)
+    assert not seq_lt(7, 7)
+
+
+def test_in_order_across_wrap():
+    buffer = ReassemblyBuffer(64536, 32768)
+    assert buffer.offer(64536, 1000) == 0
+    assert buffer.offer(0, 1000) == 1000
+    assert buffer.offer(1000, 500) == 2000
+    assert buffer.expected == 1500
+    assert buffer.delivered == 2500
+    assert len(buffer) == 0
+
+
+def test_out_of_order_across_wrap():
+    buffer = ReassemblyBuffer(64536, 32768)
+    assert buffer.offer(1000, 1000) == 2000  # two segments ahead, past the wrap
+    assert buffer.offer(0, 1000) == 1000
+    assert buffer.delivered == 0
+    assert buffer.buffered_bytes == 2000
+    assert buffer.offer(64536, 1000) == 0  # fills the hole, everything becomes contiguous
+    assert buffer.expected == 2000
+    assert buffer.delivered == 3000
+    assert buffer.buffered_bytes == 0
+    assert len(buffer) == 0
+
+
+def test_duplicates_on_both_sides_of_wrap():
+    buffer = ReassemblyBuffer(64536, 32768)
+    buffer.offer(64536, 1000)
+    buffer.offer(1000, 1000)
+    assert buffer.offer(64536, 1000) is None  # already delivered, before the wrap
+    assert buffer.offer(1000, 1000) is None  # already buffered, after the wrap
+    assert buffer.duplicates == 2
+    buffer.offer(0, 1000)
+    assert buffer.offer(0, 1000) is None  # delivered after the wrap
+    assert buffer.duplicates == 3
+    assert buffer.delivered == 3000
+
+
+def test_refuses_segments_outside_window():
+    buffer = ReassemblyBuffer(65000, 4000)
+    assert buffer.offer(seq_add(65000, 4000), 1000) is None
+    assert buffer.offer(seq_add(65000, 10000), 1000) is None
+    assert buffer.duplicates == 0
+    assert len(buffer) == 0
+    assert buffer.offer(seq_add(65000, 3000), 1000) == 3000  # last segment that fits
+
+
+def test_blocks_spanning_wrap():
+    buffer = ReassemblyBuffer(64000, 32768)
+    buffer.offer(65000, 536)
+    buffer.offer(0, 1000)  # contiguous with the one before, across the wrap
+    buffer.offer(2000, 1000)
+    assert buffer.blocks(4) == [(65000, 1000), (2000, 3000)]
+    assert buffer.blocks(1) == [(65000, 1000)]
@@ -0,0 +1,134 @@
+
+'''The sender's congestion window through a retransmission timeout, driven ACK by ACK'''
+
+import socket
+
+from ptp_header import HEADER_V1
+from ptp_log import SegmentLogger
+from sender import Sender
+
+MSS = 1000
+ISN = 100
+
+
+class ManualTimers:
+    '''TimerService stand-in that never fires, the test calls the timeouts itself'''
+    def __init__(self) -> None:
+        self.armed = {}
+
+    def schedule(self, key, delay, callback) -> None:
+        self.armed[key] = callback
+
+    def cancel(self, key) -> bool:
+        return self.armed.pop(key, None) is not None
+
+
+def make_sender(tmp_path, congestion):
+    peer = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    peer.bind(("127.0.0.1", 0))
+    peer.setblocking(False)
+    source = tmp_path / "input.bin"
+    source.write_bytes(bytes(100 * MSS))
+    sender = Sender(0, peer.getsockname()[1], str(source), 20 * MSS, 200, congestion=congestion,
+                    log_mode="off", log_file=str(tmp_path / "log.txt"))
+    sender.log = SegmentLogger(str(tmp_path / "log.txt"), "off")
+    sender.timers = ManualTimers()
+    sender.reset_state()
+    sender.start_time = 0
+    sender.handle_ack(ISN + 1, b'')  # the ACK of the SYN
+    sender.start_data()
+    return sender, peer
+
+
+def fill(sender):
+    while sender.window_open():
+        sender.send_new_segments(sender.next_batch())
+
+
+def ack(sender, acknum):
+    with sender.cond:
+        sender.receive_ack(HEADER_V1.pack(1, acknum))
+
+
+def drain(peer):
+    seqs = []
+    while True:
+        try:
+            seqs.append(HEADER_V1.unpack(peer.recv(2048))[1])
+        except BlockingIOError:
+            return seqs
+
+
+def test_slow_start_after_timeout(tmp_path):
+    sender, peer = make_sender(tmp_path, "reno")
+    try:
+        fill(sender)
+        assert len(sender.window) == 4  # initial window of 4 MSS
+        drain(peer)
+
+        # the whole window is lost, the head times out
+        sender.on_segment_timeout(ISN + 1)
+        assert sender.cc.window() == MSS
+        assert sender.lost_segments == 3
+        assert sender.in_flight() == 1
+        assert drain(peer) == [ISN + 1]
+
+        # the resent head is acked, slow start resends the next two lost segments
+        ack(sender, ISN + 1 + MSS)
+        assert sender.cc.window() == 2 * MSS
+        assert drain(peer) == [ISN + 1 + MSS, ISN + 1 + 2 * MSS]
+        assert sender.lost_segments == 1
+        ack(sender, ISN + 1 + 3 * MSS)
+        assert sender.cc.window() > 2 * MSS  # ssthresh was half the window, Reno grows linearly from there
+        assert drain(peer) == [ISN + 1 + 3 * MSS]
+        assert sender.lost_segments == 0
+        assert sender.counters["retransmissions"] == 4
+
+        # the recovery ends with the last segment outstanding at the timeout, new data flows again
+        ack(sender, ISN + 1 + 4 * MSS)
+        assert sender.recovery_point is None
+        assert sender.window_open()
+        fill(sender)
+        assert sender.in_flight() == sender.cc.window() // MSS
+    finally:
+        sender.sender_socket.close()
+        sender.log.close()
+        peer.close()
+
+
+def test_sacked_segments_are_not_resent(tmp_path):
+    sender, peer = make_sender(tmp_path, "reno")
+    sender.sack_enabled = True
+    try:
+        fill(sender)
+        drain(peer)
+        sacked = HEADER_V1.block.pack(ISN + 1 + 2 * MSS, ISN + 1 + 4 * MSS)
+        with sender.cond:
+            sender.receive_ack(HEADER_V1.pack(1, ISN + 1) + sacked)
+        sender.on_segment_timeout(ISN + 1)
+        assert sender.lost_segments == 1  # only the hole behind the head, the SACKed two are held
+        assert drain(peer) == [ISN + 1]
+        ack(sender, ISN + 1 + MSS)
+        assert drain(peer) == [ISN + 1 + MSS]
+        assert sender.lost_segments == 0
+    finally:
+        sender.sender_socket.close()
+        sender.log.close()
+        peer.close()
+
+
+def test_one_timeout_per_window(tmp_path):
+    sender, peer = make_sender(tmp_path, "reno")
+    try:
+        fill(sender)
+        sender.on_segment_timeout(ISN + 1)
+        ack(sender, ISN + 1 + MSS)  # resends two more, each with its own deadline
+        rto = sender.rtt.rto
+        sender.timers.armed[ISN + 1 + 2 * MSS]()  # ...but only the oldest one's counts
+        assert sender.counters["timeouts"] == 1
+        assert sender.rtt.rto == rto
+        assert sender.cc.window() == 2 * MSS
+    finally:
+        sender.sender_socket.close()
+        sender.log.close()
+        peer.close()